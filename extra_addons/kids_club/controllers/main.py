@@ -0,0 +1,18 @@
+from odoo import http
+from odoo.http import request
+
+from ..models.child import _render_barcode_svg
+
+
+class KidsClubController(http.Controller):
+    
+    @http.route('/kids/barcode/<string:code>.svg', type='http', auth='user')
+    def barcode(self, code):
+        """Serve a child's barcode as SVG, rendered on demand and cached by the browser"""
+        svg = _render_barcode_svg(code)
+        if not svg:
+            return request.not_found()
+        return request.make_response(svg, [
+            ('Content-Type', 'image/svg+xml'),
+            ('Cache-Control', 'private, max-age=31536000, immutable'),
+        ])
@@ -4,3 +4,4 @@ from . import res_partner
 from . import checkin
 from . import room
 from . import res_config_settings
+from . import pos_order
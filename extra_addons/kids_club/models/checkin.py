@@ -1,9 +1,23 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.tools.sql import create_index
 from datetime import datetime, timedelta
+import hashlib
+import hmac
 import random
 import string
 
+# Check-in states in which the quick check-in wizard resumes an existing record
+WIZARD_ACTIVE_STATES = ('pending_otp', 'checked_in', 'pending_checkout_otp')
+
+# Cursor cache key for subscription validation results, keyed by child id
+VALIDATION_CACHE_KEY = 'kids_sub_validation'
+
+
+def _mask_otp(last2):
+    """Display form of a sent OTP: only the last two digits are kept"""
+    return f"••••{last2}" if last2 else False
+
 
 class ChildCheckin(models.Model):
     _name = 'kids.child.checkin'
@@ -23,14 +37,16 @@ class ChildCheckin(models.Model):
     duration_minutes = fields.Integer('Duration (Minutes)', compute='_compute_duration', store=True)
     
     # OTP for check-in verification
-    otp_code = fields.Char('OTP Code', size=6)
+    otp_hash = fields.Char('OTP Hash', copy=False, groups='base.group_system')
+    otp_last2 = fields.Char('OTP (last 2 digits)', size=2, copy=False)
     otp_verified = fields.Boolean('OTP Verified', default=False)
     otp_sent_time = fields.Datetime('OTP Sent Time')
     otp_verified_time = fields.Datetime('OTP Verified Time')
     entered_otp = fields.Char('Enter OTP', help='Enter the OTP provided by parent')
     
     # OTP for check-out verification
-    checkout_otp_code = fields.Char('Checkout OTP Code', size=6)
+    checkout_otp_hash = fields.Char('Checkout OTP Hash', copy=False, groups='base.group_system')
+    checkout_otp_last2 = fields.Char('Checkout OTP (last 2 digits)', size=2, copy=False)
     checkout_otp_verified = fields.Boolean('Checkout OTP Verified', default=False)
     checkout_otp_sent_time = fields.Datetime('Checkout OTP Sent Time')
     checkout_otp_verified_time = fields.Datetime('Checkout OTP Verified Time')
@@ -68,17 +84,31 @@ class ChildCheckin(models.Model):
     # Extra billing
     extra_invoice_id = fields.Many2one('account.move', string='Extra Time Invoice')
     
-    @api.model
-    def create(self, vals):
+    def init(self):
+        """Indexes for the active check-in and wizard state lookups"""
+        create_index(self._cr, 'kids_checkin_active_idx', self._table, ['child_id'],
+                     where="checkout_time IS NULL AND state IN ('checked_in', 'pending_checkout_otp')")
+        # Wizard lookup by child and open state (see _fetch_wizard_state)
+        create_index(self._cr, 'kids_child_checkin_child_state_idx', self._table, ['child_id', 'state'])
+    
+    @api.model_create_multi
+    def create(self, vals_list):
         """Override create to generate sequence number and validate room capacity"""
-        if vals.get('name', 'New') == 'New':
-            vals['name'] = self.env['ir.sequence'].next_by_code('kids.child.checkin') or 'New'
-        
-        # Validate room capacity before creating check-in (only if room is specified)
-        if vals.get('room_id'):
-            self._validate_room_capacity(vals['room_id'])
+        # Checked-in records earlier in this batch, not yet in the database, per room
+        pending_by_room = {}
+        for vals in vals_list:
+            if vals.get('name', 'New') == 'New':
+                vals['name'] = self.env['ir.sequence'].next_by_code('kids.child.checkin') or 'New'
+            
+            # Validate room capacity before creating check-in (only if room is specified)
+            room_id = vals.get('room_id')
+            if room_id:
+                self._validate_room_capacity(room_id, pending=pending_by_room.get(room_id, 0))
+                if vals.get('state') == 'checked_in':
+                    pending_by_room[room_id] = pending_by_room.get(room_id, 0) + 1
         
-        return super().create(vals)
+        self._clear_validation_cache()
+        return super().create(vals_list)
     
     def write(self, vals):
         """Override write to validate room capacity when room is changed"""
@@ -88,10 +118,16 @@ class ChildCheckin(models.Model):
                 if record.room_id.id != vals['room_id'] and record.state in ['pending_otp', 'checked_in']:
                     self._validate_room_capacity(vals['room_id'], exclude_record=record)
         
+        self._clear_validation_cache()
         return super().write(vals)
     
-    def _validate_room_capacity(self, room_id, exclude_record=None):
-        """Validate that room has available capacity"""
+    def unlink(self):
+        """Override unlink to drop cached subscription validations"""
+        self._clear_validation_cache()
+        return super().unlink()
+    
+    def _validate_room_capacity(self, room_id, exclude_record=None, pending=0):
+        """Validate that room has available capacity, counting `pending` not yet created check-ins"""
         room = self.env['kids.room'].browse(room_id)
         if not room.exists():
             raise ValidationError("Selected room does not exist.")
@@ -101,7 +137,7 @@ class ChildCheckin(models.Model):
         if exclude_record:
             domain.append(('id', '!=', exclude_record.id))
         
-        current_checkins = self.search_count(domain)
+        current_checkins = self.search_count(domain) + pending
         
         if current_checkins >= room.capacity:
             raise ValidationError(
@@ -112,13 +148,14 @@ class ChildCheckin(models.Model):
     @api.depends('checkin_time', 'checkout_time')
     def _compute_duration(self):
         """Compute duration in minutes"""
+        now = fields.Datetime.now()
         for record in self:
             if record.checkin_time and record.checkout_time:
                 delta = record.checkout_time - record.checkin_time
                 record.duration_minutes = int(delta.total_seconds() / 60)
             elif record.checkin_time and not record.checkout_time:
                 # For ongoing sessions, calculate current duration
-                delta = fields.Datetime.now() - record.checkin_time
+                delta = now - record.checkin_time
                 record.duration_minutes = int(delta.total_seconds() / 60)
             else:
                 record.duration_minutes = 0
@@ -126,10 +163,11 @@ class ChildCheckin(models.Model):
     @api.depends('checkin_time', 'checkout_time', 'state', 'allowed_minutes')
     def _compute_live_timer(self):
         """Compute live timer display - countdown for allowed time, positive for extra time"""
+        now = fields.Datetime.now()
         for record in self:
             if record.state == 'checked_in' and record.checkin_time and not record.checkout_time:
                 # Calculate current duration for active check-ins
-                delta = fields.Datetime.now() - record.checkin_time
+                delta = now - record.checkin_time
                 total_seconds = int(delta.total_seconds())
                 
                 # Use the computed allowed_minutes field
@@ -299,14 +337,20 @@ class ChildCheckin(models.Model):
             else:
                 record.extra_charges = 0.0
     
+    def _hash_otp(self, otp):
+        """Keyed hash of an OTP, salted with the database secret and the check-in id"""
+        secret = self.env['ir.config_parameter'].sudo().get_param('database.secret', '')
+        return hmac.new(secret.encode(), f"{self.id}:{otp}".encode(), hashlib.sha256).hexdigest()
+    
     def action_send_otp(self):
         """Send OTP to parent for check-in verification"""
         self.ensure_one()
         
         # Generate 6-digit OTP
         otp = ''.join(random.choices(string.digits, k=6))
-        self.write({
-            'otp_code': otp,
+        self.sudo().write({
+            'otp_hash': self._hash_otp(otp),
+            'otp_last2': otp[-2:],
             'otp_sent_time': fields.Datetime.now()
         })
         
@@ -373,10 +417,11 @@ class ChildCheckin(models.Model):
         """Verify OTP and complete check-in"""
         self.ensure_one()
         
-        if not self.otp_code:
+        otp_hash = self.sudo().otp_hash
+        if not otp_hash:
             raise ValidationError("No OTP has been sent. Please send OTP first.")
         
-        if entered_otp != self.otp_code:
+        if not hmac.compare_digest(self._hash_otp(entered_otp or ''), otp_hash):
             raise ValidationError("Invalid OTP. Please try again.")
         
         # Check OTP expiry (5 minutes)
@@ -476,8 +521,9 @@ class ChildCheckin(models.Model):
         
         # Generate 6-digit OTP for checkout
         otp = ''.join(random.choices(string.digits, k=6))
-        self.write({
-            'checkout_otp_code': otp,
+        self.sudo().write({
+            'checkout_otp_hash': self._hash_otp(otp),
+            'checkout_otp_last2': otp[-2:],
             'checkout_otp_sent_time': fields.Datetime.now()
         })
         
@@ -544,10 +590,11 @@ class ChildCheckin(models.Model):
         """Verify checkout OTP and complete check-out"""
         self.ensure_one()
         
-        if not self.checkout_otp_code:
+        otp_hash = self.sudo().checkout_otp_hash
+        if not otp_hash:
             raise ValidationError("No checkout OTP has been sent. Please send checkout OTP first.")
         
-        if entered_otp != self.checkout_otp_code:
+        if not hmac.compare_digest(self._hash_otp(entered_otp or ''), otp_hash):
             raise ValidationError("Invalid checkout OTP. Please try again.")
         
         # Check OTP expiry (5 minutes)
@@ -707,6 +754,19 @@ class ChildCheckin(models.Model):
     
     @api.model
     def validate_active_subscription(self, child_id):
+        """Validate if child has active subscription for check-in (cached for the transaction)"""
+        cache = self.env.cr.cache.setdefault(VALIDATION_CACHE_KEY, {})
+        if child_id not in cache:
+            cache[child_id] = self._validate_active_subscription(child_id)
+        return dict(cache[child_id])
+    
+    @api.model
+    def _clear_validation_cache(self):
+        """Drop cached validation results after check-ins or subscriptions change"""
+        self.env.cr.cache.pop(VALIDATION_CACHE_KEY, None)
+    
+    @api.model
+    def _validate_active_subscription(self, child_id):
         """Validate if child has active subscription for check-in"""
         child = self.env['kids.child'].browse(child_id)
         
@@ -731,33 +791,88 @@ class ChildCheckin(models.Model):
                 'message': 'Child is already checked in'
             }
         
+        subscription = active_subscription[0]
         return {
             'valid': True,
-            'subscription': active_subscription[0],
+            'subscription_id': subscription.id,
+            'remaining_visits': subscription.remaining_visits,
             'message': 'Ready for check-in'
         }
     
     @api.model
-    def create_checkin_request(self, child_id, room_id=None):
-        """Create a new check-in request and send OTP"""
-        validation = self.validate_active_subscription(child_id)
-        
-        if not validation['valid']:
-            raise ValidationError(validation['message'])
+    def _get_active_for_child(self, child_id, states=WIZARD_ACTIVE_STATES):
+        """Return the child's latest check-in in one of ``states`` as a dict, or None"""
+        self.flush_model(['child_id', 'state', 'otp_last2', 'checkout_otp_last2', 'subscription_id', 'checkin_time'])
+        self.env['kids.child.subscription'].flush_model(['remaining_visits'])
+        # The subscription's remaining visits come along in the same query
+        self.env.cr.execute("""
+            SELECT c.id, c.state, c.otp_last2, c.checkout_otp_last2, c.subscription_id,
+                   s.remaining_visits
+              FROM kids_child_checkin c
+         LEFT JOIN kids_child_subscription s ON s.id = c.subscription_id
+             WHERE c.child_id = %s AND c.state IN %s
+          ORDER BY c.checkin_time DESC
+             LIMIT 1
+        """, [child_id, tuple(states)])
+        return self.env.cr.dictfetchone()
+    
+    @api.model
+    def _fetch_wizard_state(self, child_id):
+        """Return the child's open check-in, or its subscription validation, as plain values"""
+        row = self._get_active_for_child(child_id)
+        if not row:
+            return {'checkin_id': False, **self.validate_active_subscription(child_id)}
         
-        # Create check-in record
-        vals = {
-            'child_id': child_id,
-            'subscription_id': validation['subscription'].id,
+        return {
+            'checkin_id': row['id'],
+            'state': row['state'],
+            'otp_last2': row['otp_last2'],
+            'checkout_otp_last2': row['checkout_otp_last2'],
+            'subscription_id': row['subscription_id'],
+            'remaining_visits': row['remaining_visits'] or 0,
         }
-        if room_id:
-            vals['room_id'] = room_id
+    
+    @api.model
+    def create_checkin_request(self, child_id, room_id=None):
+        """Create a new check-in request and send OTP"""
+        return self.create_checkin_requests([child_id], room_id)
+    
+    @api.model
+    def create_checkin_requests(self, child_ids, room_id=None):
+        """Create check-in requests for several children in one batch and send their OTPs"""
+        vals_list = []
+        for child_id in child_ids:
+            validation = self.validate_active_subscription(child_id)
+            
+            if not validation['valid']:
+                raise ValidationError(validation['message'])
             
-        checkin = self.create(vals)
+            # Create check-in record
+            vals = {
+                'child_id': child_id,
+                'subscription_id': validation['subscription_id'],
+            }
+            if room_id:
+                vals['room_id'] = room_id
+            vals_list.append(vals)
+        
+        checkins = self.create(vals_list)
         
         # Send OTP
-        checkin.action_send_otp()
+        for checkin in checkins:
+            checkin.action_send_otp()
+        
+        return checkins
+    
+    @api.model
+    def verify_checkin_request(self, checkin_id, otp_code):
+        """Verify the OTP of a given pending check-in in a single call"""
+        checkin = self.browse(checkin_id).exists()
+        
+        if not checkin or checkin.state != 'pending_otp':
+            raise ValidationError("No pending check-in found. Please send OTP first.")
         
+        checkin.action_verify_otp(otp_code)
         return checkin
 
 
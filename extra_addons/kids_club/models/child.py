@@ -1,14 +1,62 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from odoo.tools.sql import create_index, drop_index
 from datetime import datetime, timedelta, date
 import uuid
 import json
 import time
-import base64
+try:
+    import pybase64
+except ImportError:
+    import base64 as pybase64
 import io
 from PIL import Image, ImageDraw, ImageFont
 import barcode
-from barcode.writer import ImageWriter
+from functools import lru_cache
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Context for bulk state transitions run by crons: skip mail tracking and follower churn
+NO_TRACKING_CONTEXT = {
+    'tracking_disable': True,
+    'mail_notrack': True,
+    'mail_create_nosubscribe': True,
+}
+
+
+@lru_cache(maxsize=1024)
+def _render_barcode_svg(code):
+    """Render a Code128 barcode as SVG bytes for the /kids/barcode controller"""
+    if not code:
+        return False
+    try:
+        code128 = barcode.get_barcode_class('code128')
+        return code128(code).render()
+    except Exception:
+        return False
+
+
+def _render_thumbnail(image_data, size):
+    """Resize a base64 image to a base64 PNG thumbnail (module level so it can be pickled)"""
+    if not image_data:
+        return False
+    try:
+        # BytesIO shares the decoded buffer instead of copying it; closing it once the
+        # pixels are loaded releases the decoded blob before the thumbnail is built
+        with io.BytesIO(pybase64.b64decode(image_data, validate=False)) as buffer:
+            img = Image.open(buffer)
+            # Let the JPEG decoder downscale while decoding (no-op for other formats)
+            img.draft(None, size)
+            img.load()
+        img.thumbnail(size, Image.Resampling.LANCZOS)
+        
+        output_stream = io.BytesIO()
+        img.save(output_stream, format='PNG')
+        
+        return pybase64.b64encode(output_stream.getvalue())
+    except Exception:
+        return False
 
 
 class Child(models.Model):
@@ -39,7 +87,7 @@ class Child(models.Model):
     
     # Barcode fields
     barcode_id = fields.Char('Barcode ID', required=True, copy=False, default=lambda self: self._generate_barcode_id())
-    barcode_image = fields.Binary('Barcode Image', compute='_compute_barcode_image', store=True)
+    barcode_image_url = fields.Char('Barcode', compute='_compute_barcode_image_url')
     
     # Additional Information
     emergency_contact = fields.Char('Emergency Contact')
@@ -56,12 +104,14 @@ class Child(models.Model):
     current_subscription_id = fields.Many2one('kids.child.subscription', string='Current Subscription', 
                                             compute='_compute_current_subscription', store=True)
     subscription_count = fields.Integer('Subscription Count', compute='_compute_subscription_count')
+    remaining_visits = fields.Integer('Remaining Visits', compute='_compute_remaining_visits',
+                                      help="Visits left across the child's usable subscriptions")
     
     # Check-in/Check-out Information
     checkin_ids = fields.One2many('kids.child.checkin', 'child_id', string='Check-ins')
-    is_checked_in = fields.Boolean('Currently Checked In', compute='_compute_checkin_status')
+    is_checked_in = fields.Boolean('Currently Checked In', compute='_compute_checkin_status', store=True)
     current_checkin_id = fields.Many2one('kids.child.checkin', string='Current Check-in', 
-                                        compute='_compute_checkin_status')
+                                        compute='_compute_checkin_status', store=True)
     
     @api.model
     def _generate_barcode_id(self):
@@ -80,24 +130,12 @@ class Child(models.Model):
         # If we couldn't generate a unique ID after max attempts, raise an error
         raise ValidationError("Unable to generate a unique barcode ID. Please contact administrator.")
     
-    @api.constrains('barcode_id')
-    def _check_barcode_uniqueness(self):
-        """Ensure barcode ID is unique"""
-        for record in self:
-            if record.barcode_id:
-                duplicate = self.search([
-                    ('barcode_id', '=', record.barcode_id),
-                    ('id', '!=', record.id)
-                ], limit=1)
-                if duplicate:
-                    raise ValidationError(f"Barcode ID '{record.barcode_id}' already exists for child '{duplicate.name}'. Each child must have a unique barcode ID.")
-    
     @api.depends('date_of_birth')
     def _compute_age(self):
         """Calculate age from date of birth"""
+        today = date.today()
         for record in self:
             if record.date_of_birth:
-                today = date.today()
                 record.age = today.year - record.date_of_birth.year - (
                     (today.month, today.day) < (record.date_of_birth.month, record.date_of_birth.day)
                 )
@@ -105,65 +143,44 @@ class Child(models.Model):
                 record.age = 0
     
     @api.depends('barcode_id')
-    def _compute_barcode_image(self):
-        """Generate barcode image"""
+    def _compute_barcode_image_url(self):
+        """URL of the on-demand SVG barcode served by the kids club controller"""
         for record in self:
-            if record.barcode_id:
-                try:
-                    # Generate barcode using Code128
-                    code128 = barcode.get_barcode_class('code128')
-                    barcode_instance = code128(record.barcode_id, writer=ImageWriter())
-                    
-                    # Create image buffer
-                    buffer = io.BytesIO()
-                    barcode_instance.write(buffer)
-                    buffer.seek(0)
-                    
-                    # Convert to base64
-                    record.barcode_image = base64.b64encode(buffer.getvalue())
-                except Exception:
-                    record.barcode_image = False
-            else:
-                record.barcode_image = False
+            record.barcode_image_url = f"/kids/barcode/{record.barcode_id}.svg" if record.barcode_id else False
     
     @api.depends('image')
     def _compute_image_medium(self):
         """Compute medium sized image"""
         for record in self:
-            if record.image:
-                record.image_medium = self._resize_image(record.image, (128, 128))
-            else:
-                record.image_medium = False
+            record.image_medium = record._resize_image(record.image, (128, 128))
     
     @api.depends('image')
     def _compute_image_small(self):
         """Compute small sized image"""
         for record in self:
-            if record.image:
-                record.image_small = self._resize_image(record.image, (64, 64))
-            else:
-                record.image_small = False
+            record.image_small = record._resize_image(record.image, (64, 64))
     
     def _resize_image(self, image_data, size):
         """Resize image to specified size"""
-        try:
-            image_stream = io.BytesIO(base64.b64decode(image_data))
-            img = Image.open(image_stream)
-            img.thumbnail(size, Image.Resampling.LANCZOS)
-            
-            output_stream = io.BytesIO()
-            img.save(output_stream, format='PNG')
-            output_stream.seek(0)
-            
-            return base64.b64encode(output_stream.getvalue())
-        except Exception:
-            return False
+        return _render_thumbnail(image_data, size)
     
     @api.depends('subscription_ids')
     def _compute_subscription_count(self):
         for record in self:
             record.subscription_count = len(record.subscription_ids)
     
+    @api.depends('subscription_ids.remaining_visits', 'subscription_ids.state', 'subscription_ids.is_active')
+    def _compute_remaining_visits(self):
+        """Sum remaining visits of usable subscriptions for all children in one query"""
+        groups = self.env['kids.child.subscription'].read_group([
+            ('child_id', 'in', self._origin.ids),
+            ('state', 'in', ['active', 'paid']),
+            ('is_active', '=', True)
+        ], ['child_id', 'remaining_visits:sum'], ['child_id'])
+        totals = {group['child_id'][0]: group['remaining_visits'] for group in groups}
+        for record in self:
+            record.remaining_visits = totals.get(record._origin.id, 0)
+    
     @api.depends('checkin_ids.checkout_time', 'checkin_ids.state')
     def _compute_checkin_status(self):
         """Compute if child is currently checked in"""
@@ -181,32 +198,51 @@ class Child(models.Model):
     
     @api.depends('subscription_ids', 'subscription_ids.state', 'subscription_ids.end_date')
     def _compute_current_subscription(self):
+        """Pick the latest active subscription per child with a single query"""
+        child_ids = tuple(self._origin.ids)
+        mapping = {}
+        if child_ids:
+            self.env['kids.child.subscription'].flush_model(['child_id', 'state', 'start_date', 'end_date'])
+            today = fields.Date.today()
+            self.env.cr.execute("""
+                SELECT DISTINCT ON (child_id) child_id, id
+                  FROM kids_child_subscription
+                 WHERE child_id IN %s
+                   AND state = 'active'
+                   AND start_date <= %s
+                   AND end_date >= %s
+              ORDER BY child_id, start_date DESC
+            """, (child_ids, today, today))
+            mapping = dict(self.env.cr.fetchall())
         for child in self:
-            active_subscription = child.subscription_ids.filtered(
-                lambda s: s.state == 'active' and s.start_date <= fields.Date.today() <= s.end_date
-            )
-            child.current_subscription_id = active_subscription[0] if active_subscription else False
+            child.current_subscription_id = mapping.get(child._origin.id, False)
     
     @api.model
     def create(self, vals):
-        """Override create to ensure barcode_id is unique"""
+        """Override create to ensure a barcode_id is assigned (uniqueness is enforced by SQL)"""
         if not vals.get('barcode_id'):
             vals['barcode_id'] = self._generate_barcode_id()
         
-        # Ensure barcode_id is unique
-        while self.search([('barcode_id', '=', vals['barcode_id'])]):
-            vals['barcode_id'] = self._generate_barcode_id()
-        
-        return super(Child, self).create(vals)
+        child = super(Child, self).create(vals)
+        child.parent_id._sync_kids_club_parent()
+        return child
     
-    @api.constrains('barcode_id')
-    def _check_barcode_unique(self):
-        """Ensure barcode_id is unique"""
-        for record in self:
-            if record.barcode_id:
-                domain = [('barcode_id', '=', record.barcode_id), ('id', '!=', record.id)]
-                if self.search_count(domain):
-                    raise models.ValidationError(f"Barcode ID '{record.barcode_id}' already exists!")
+    def write(self, vals):
+        """Override write to keep parent flags and cached subscription validations in sync"""
+        old_parents = self.parent_id if {'parent_id', 'active'} & vals.keys() else None
+        self.env['kids.child.checkin']._clear_validation_cache()
+        result = super(Child, self).write(vals)
+        if old_parents is not None:
+            (old_parents | self.parent_id)._sync_kids_club_parent()
+        return result
+    
+    def unlink(self):
+        """Override unlink to clear is_kids_club_parent on parents left without children"""
+        parents = self.parent_id
+        self.env['kids.child.checkin']._clear_validation_cache()
+        result = super(Child, self).unlink()
+        parents._sync_kids_club_parent()
+        return result
     
     def action_view_subscriptions(self):
         """Action to view subscriptions for this child"""
@@ -284,7 +320,14 @@ class Child(models.Model):
     def action_bulk_checkin(self):
         """Bulk check-in for multiple selected children"""
         # Filter only children that can be checked in (not already checked in and active)
-        eligible_children = self.filtered(lambda c: not c.is_checked_in and c.active)
+        active_children = self.filtered('active')
+        busy_groups = self.env['kids.child.checkin'].read_group([
+            ('child_id', 'in', active_children.ids),
+            ('checkout_time', '=', False),
+            ('state', 'in', ['checked_in', 'pending_checkout_otp'])
+        ], ['child_id'], ['child_id'])
+        busy_ids = {group['child_id'][0] for group in busy_groups}
+        eligible_children = active_children.filtered(lambda c: c.id not in busy_ids)
         
         if not eligible_children:
             return {
@@ -346,8 +389,8 @@ class ChildSubscription(models.Model):
     ], string='Status', default='draft', tracking=True)
     activation_date = fields.Datetime('Activation Date', help='Date when subscription was activated (payment received)')
     # Activity status - separate from workflow state
-    is_active = fields.Boolean('Is Active', compute='_compute_is_active', store=True)
-    activity_status = fields.Char('Activity Status', compute='_compute_activity_status')
+    is_active = fields.Boolean('Is Active', compute='_compute_activity_status', store=True)
+    activity_status = fields.Char('Activity Status', compute='_compute_activity_status', store=True)
     
     # Payment monitoring
     is_fully_paid = fields.Boolean(
@@ -363,8 +406,8 @@ class ChildSubscription(models.Model):
     remaining_visits = fields.Integer('Remaining Visits', compute='_compute_visit_fields', store=True)
     
     # Pricing
-    price = fields.Monetary('Price', compute='_compute_price', store=True)
-    total_price = fields.Monetary('Total Price', compute='_compute_total_price', store=True)
+    price = fields.Monetary('Price', compute='_compute_prices', store=True)
+    total_price = fields.Monetary('Total Price', compute='_compute_prices', store=True)
     currency_id = fields.Many2one('res.currency', string='Currency', 
                                  default=lambda self: self._get_default_currency())
     
@@ -378,7 +421,7 @@ class ChildSubscription(models.Model):
         compute='_compute_matched_payment_ids',
         copy=False,
     )
-    payment_ids = fields.Many2many('account.payment', compute='_compute_payment_ids', string='Payments')
+    payment_ids = fields.Many2many('account.payment', compute='_compute_matched_payment_ids', string='Payments')
     payment_count = fields.Integer(compute='_compute_payment_count')
     
     # Payment Integration
@@ -388,12 +431,24 @@ class ChildSubscription(models.Model):
     
     display_name = fields.Char('Display Name', compute='_compute_display_name', store=True)
     
-    @api.model
-    def create(self, vals):
-        """Override create to generate sequence number"""
-        if vals.get('name', 'New') == 'New':
-            vals['name'] = self.env['ir.sequence'].next_by_code('kids.child.subscription') or 'New'
-        return super().create(vals)
+    def init(self):
+        """Indexes for the current subscription lookup and the status cron"""
+        create_index(self._cr, 'kids_child_subscription_current_idx', self._table,
+                     ['child_id', 'state', 'start_date', 'end_date'])
+        # Status cron scans
+        create_index(self._cr, 'ksub_state_end_idx', self._table, ['state', 'end_date'])
+        # Superseded by the two indexes above
+        drop_index(self._cr, 'kids_sub_active_idx', self._table)
+        drop_index(self._cr, 'ksub_active_end', self._table)
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Override create to generate sequence numbers"""
+        for vals in vals_list:
+            if vals.get('name', 'New') == 'New':
+                vals['name'] = self.env['ir.sequence'].next_by_code('kids.child.subscription') or 'New'
+        self.env['kids.child.checkin']._clear_validation_cache()
+        return super().create(vals_list)
     
     @api.model
     def _get_default_currency(self):
@@ -408,22 +463,26 @@ class ChildSubscription(models.Model):
         except Exception:
             return 1
     
+    def _prefetch_packages(self):
+        """Load the package columns used by the subscription computes in one batch"""
+        packages = self.mapped('package_ids') | self.mapped('package_id')
+        if packages:
+            packages.read(['price', 'number_of_visits', 'validity_days'])
+    
     @api.depends('package_id.price', 'package_ids.price')
-    def _compute_price(self):
+    def _compute_prices(self):
+        self._prefetch_packages()
         for record in self:
+            record.total_price = sum(record.package_ids.mapped('price'))
             if record.package_ids:
-                record.price = sum(record.package_ids.mapped('price'))
+                record.price = record.total_price
             else:
                 record.price = record.package_id.price if record.package_id else 0.0
     
-    @api.depends('package_ids.price')
-    def _compute_total_price(self):
-        for record in self:
-            record.total_price = sum(record.package_ids.mapped('price'))
-    
     @api.depends('package_id.number_of_visits', 'package_ids.number_of_visits', 'visits_used')
     def _compute_visit_fields(self):
         """Compute total visits allowed and remaining visits"""
+        self._prefetch_packages()
         for record in self:
             # Calculate total visits allowed from packages
             total_visits = 0
@@ -439,6 +498,7 @@ class ChildSubscription(models.Model):
     @api.depends('start_date', 'package_id.validity_days', 'package_ids.validity_days')
     def _compute_end_date(self):
         """Compute end date based on start date and package validity"""
+        self._prefetch_packages()
         for record in self:
             if record.start_date:
                 # Get validity days from selected packages or single package
@@ -486,53 +546,56 @@ class ChildSubscription(models.Model):
         for record in self:
             record.invoice_count = len(record.invoice_ids)
     
+    @api.depends('invoice_ids', 'invoice_ids.payment_state',
+                 'invoice_ids.line_ids.matched_debit_ids', 'invoice_ids.line_ids.matched_credit_ids')
     def _compute_matched_payment_ids(self):
-        """Compute matched payments from invoices using Odoo's reconciliation approach"""
+        """Compute payments reconciled with the subscription invoices in a single query"""
+        subscription_ids = tuple(self._origin.ids)
+        payment_map = {}
+        if subscription_ids:
+            self.flush_model(['pos_order_id'])
+            self.env['pos.order'].flush_model(['account_move'])
+            matched_field = self.env['account.move']._fields.get('matched_payment_ids')
+            if matched_field:
+                # Invoices track their payments directly (including ones without a
+                # journal entry or reconciliation yet): read the relation table
+                self.env['account.move'].flush_model(['matched_payment_ids'])
+                self.env.cr.execute(f"""
+                    SELECT sub.id, array_agg(DISTINCT rel.{matched_field.column2})
+                      FROM kids_child_subscription sub
+                      JOIN pos_order po ON po.id = sub.pos_order_id
+                      JOIN {matched_field.relation} rel ON rel.{matched_field.column1} = po.account_move
+                     WHERE sub.id IN %s
+                  GROUP BY sub.id
+                """, (subscription_ids,))
+            else:
+                # Fall back to the reconciliation of the receivable/payable lines
+                self.env['account.move.line'].flush_model(['move_id', 'account_id'])
+                self.env['account.account'].flush_model(['account_type'])
+                self.env['account.partial.reconcile'].flush_model(['debit_move_id', 'credit_move_id'])
+                self.env['account.payment'].flush_model(['move_id'])
+                self.env.cr.execute("""
+                    SELECT sub.id, array_agg(DISTINCT pay.id)
+                      FROM kids_child_subscription sub
+                      JOIN pos_order po ON po.id = sub.pos_order_id
+                      JOIN account_move_line inv_line ON inv_line.move_id = po.account_move
+                      JOIN account_account acc ON acc.id = inv_line.account_id
+                       AND acc.account_type IN ('asset_receivable', 'liability_payable')
+                      JOIN account_partial_reconcile apr
+                        ON apr.debit_move_id = inv_line.id OR apr.credit_move_id = inv_line.id
+                      JOIN account_move_line pay_line ON pay_line.id = CASE
+                           WHEN apr.debit_move_id = inv_line.id THEN apr.credit_move_id
+                           ELSE apr.debit_move_id END
+                      JOIN account_payment pay ON pay.move_id = pay_line.move_id
+                     WHERE sub.id IN %s
+                  GROUP BY sub.id
+                """, (subscription_ids,))
+            payment_map = dict(self.env.cr.fetchall())
+        
+        Payment = self.env['account.payment']
         for record in self:
-            payments = self.env['account.payment']
-            
-            if record.invoice_ids:
-                for invoice in record.invoice_ids:
-                    # Use the invoice's matched_payment_ids if available
-                    if hasattr(invoice, 'matched_payment_ids'):
-                        payments |= invoice.matched_payment_ids
-                    else:
-                        # Fallback to reconciliation-based detection
-                        receivable_lines = invoice.line_ids.filtered(
-                            lambda line: line.account_id.account_type in ('asset_receivable', 'liability_payable')
-                        )
-                        
-                        for line in receivable_lines:
-                            reconciled_lines = line.matched_debit_ids.mapped('debit_move_id') | \
-                                             line.matched_credit_ids.mapped('credit_move_id')
-                            
-                            payment_lines = reconciled_lines.filtered(lambda l: l.payment_id)
-                            payments |= payment_lines.mapped('payment_id')
-            
+            payments = Payment.browse(payment_map.get(record._origin.id, []))
             record.matched_payment_ids = payments
-
-    def _compute_payment_ids(self):
-        """Compute related payments from invoices using reconciliation"""
-        for record in self:
-            payments = self.env['account.payment']
-            
-            if record.invoice_ids:
-                for invoice in record.invoice_ids:
-                    # Get receivable/payable lines from the invoice
-                    receivable_lines = invoice.line_ids.filtered(
-                        lambda line: line.account_id.account_type in ('asset_receivable', 'liability_payable')
-                    )
-                    
-                    # Get all payments that are reconciled with these lines
-                    for line in receivable_lines:
-                        # Get reconciled move lines
-                        reconciled_lines = line.matched_debit_ids.mapped('debit_move_id') | \
-                                         line.matched_credit_ids.mapped('credit_move_id')
-                        
-                        # Filter for payment move lines and get their payments
-                        payment_lines = reconciled_lines.filtered(lambda l: l.payment_id)
-                        payments |= payment_lines.mapped('payment_id')
-            
             record.payment_ids = payments
     
     @api.depends('matched_payment_ids')
@@ -541,23 +604,14 @@ class ChildSubscription(models.Model):
             record.payment_count = len(record.matched_payment_ids)
     
     @api.depends('start_date', 'end_date', 'state')
-    def _compute_is_active(self):
+    def _compute_activity_status(self):
         """Compute if subscription is currently active based on dates and payment status"""
         today = fields.Date.today()
         for record in self:
-            if record.state == 'paid' and record.start_date and record.end_date:
-                record.is_active = record.start_date <= today <= record.end_date
-            else:
-                record.is_active = False
-    
-    @api.depends('is_active')
-    def _compute_activity_status(self):
-        """Compute activity status display"""
-        for record in self:
-            if record.is_active:
-                record.activity_status = 'Active'
-            else:
-                record.activity_status = 'Inactive'
+            active = bool(record.state == 'paid' and record.start_date and record.end_date
+                          and record.start_date <= today <= record.end_date)
+            record.is_active = active
+            record.activity_status = 'Active' if active else 'Inactive'
     
     @api.depends('name', 'child_id.name', 'package_ids', 'start_date')
     def _compute_display_name(self):
@@ -806,52 +860,32 @@ class ChildSubscription(models.Model):
         
         return pos_order
     
-    @api.depends('pos_order_id', 'pos_order_id.state')
+    @api.depends('pos_order_id', 'pos_order_id.state', 'pos_order_id.account_move')
     def _compute_payment_status(self):
-        """Compute payment status based on POS order and auto-update subscription state"""
-        import logging
-        _logger = logging.getLogger(__name__)
-        
+        """Compute payment status based on POS order"""
         for record in self:
-            _logger.info(f"Checking POS payment status for subscription {record.name}")
-            
-            if not record.pos_order_id:
-                _logger.info(f"No POS order found for subscription {record.name}")
-                record.is_fully_paid = False
-                continue
-            
-            _logger.info(f"POS order {record.pos_order_id.name}: state={record.pos_order_id.state}")
-            
-            # Check if POS order is paid or invoiced (both indicate payment received)
-            # POS states: draft, cancel, paid, done
-            # Also check invoice_status and account_move for comprehensive coverage
-            pos_state = record.pos_order_id.state
-            has_invoice = bool(record.pos_order_id.account_move)
-            invoice_status = getattr(record.pos_order_id, 'invoice_status', None)
-            
-            # Payment is received if: state is 'paid' or 'done', OR has invoice (means payment was processed)
-            pos_paid = pos_state in ['paid', 'done'] or has_invoice
-            record.is_fully_paid = pos_paid
-            
-            _logger.info(f"POS order state: {pos_state}, invoice_status: {invoice_status}, has_invoice: {has_invoice}, Payment received: {pos_paid}, Current subscription state: {record.state}")
-            
-            # Auto-update subscription state to 'paid' when POS order is paid or invoiced
-            if pos_paid and record.state == 'confirmed':
-                _logger.info(f"Updating subscription {record.name} state to 'paid' (POS payment received - state: {record.pos_order_id.state})")
-                record.with_context(skip_payment_check=True).write({
-                    'state': 'paid',
-                    'activation_date': fields.Datetime.now()
-                })
-            else:
-                _logger.info(f"Not updating state: pos_paid={pos_paid}, state={record.state}")
+            # POS states: draft, cancel, paid, done; an invoice also means payment was processed
+            pos_order = record.pos_order_id
+            record.is_fully_paid = bool(pos_order) and (pos_order.state in ['paid', 'done'] or bool(pos_order.account_move))
+    
+    def _sync_state_from_payment(self):
+        """Move confirmed subscriptions to 'paid' once their POS order has been paid"""
+        to_pay = self.filtered(lambda s: s.state == 'confirmed' and s.is_fully_paid)
+        if to_pay:
+            _logger.debug("Marking subscriptions %s as paid (POS payment received)", to_pay.mapped('name'))
+            to_pay.with_context(skip_payment_check=True).write({
+                'state': 'paid',
+                'activation_date': fields.Datetime.now()
+            })
     
     def write(self, vals):
-        """Override write to trigger payment status check when invoices change"""
+        """Override write to sync subscription state when the POS order changes"""
+        self.env['kids.child.checkin']._clear_validation_cache()
         result = super().write(vals)
         
-        # If pos_order_id changed, recompute payment status
-        if 'pos_order_id' in vals:
-            self._compute_payment_status()
+        # If pos_order_id changed, the order may already be paid
+        if 'pos_order_id' in vals and not self.env.context.get('skip_payment_check'):
+            self._sync_state_from_payment()
         
         return result
     
@@ -864,8 +898,7 @@ class ChildSubscription(models.Model):
             ('pos_order_id', '!=', False)
         ])
         
-        for subscription in confirmed_subscriptions:
-            subscription._compute_payment_status()
+        confirmed_subscriptions.with_context(**NO_TRACKING_CONTEXT)._sync_state_from_payment()
     
     def action_check_payment_status(self):
         """Manual action to check and update payment status"""
@@ -876,7 +909,8 @@ class ChildSubscription(models.Model):
         _logger.info(f"Manual payment status check triggered for {self.name}")
         
         # Direct payment status check without computed field
-        if not self.invoice_ids:
+        invoices = self.invoice_ids
+        if not invoices:
             message = "No invoices found for this subscription."
             _logger.info(message)
             return {
@@ -889,9 +923,9 @@ class ChildSubscription(models.Model):
                 }
             }
         
-        posted_invoices = self.invoice_ids.filtered(lambda inv: inv.state == 'posted')
+        posted_invoices = invoices.filtered(lambda inv: inv.state == 'posted')
         if not posted_invoices:
-            message = f"Found {len(self.invoice_ids)} invoices, but none are posted yet."
+            message = f"Found {len(invoices)} invoices, but none are posted yet."
             _logger.info(message)
             return {
                 'type': 'ir.actions.client',
@@ -903,25 +937,24 @@ class ChildSubscription(models.Model):
                 }
             }
         
-        # Check each invoice payment status
-        payment_info = []
-        all_paid = True
-        for invoice in posted_invoices:
-            is_paid = invoice.payment_state == 'paid'
-            payment_info.append(f"Invoice {invoice.name}: {invoice.payment_state}")
-            if not is_paid:
-                all_paid = False
+        # Check each invoice payment status (one read for just the needed columns)
+        rows = posted_invoices.read(['name', 'payment_state'])
+        all_paid = all(row['payment_state'] == 'paid' for row in rows)
         
-        _logger.info(f"Payment status check: {payment_info}")
+        _logger.info("Payment status check for %s: all paid = %s", self.name, all_paid)
         
         if all_paid and self.state == 'confirmed':
             # Update state directly
             self.write({'state': 'paid'})
-            message = f"All invoices are paid! Subscription updated to 'Paid' status.\n\n" + "\n".join(payment_info)
+            summary = "All invoices are paid! Subscription updated to 'Paid' status."
             _logger.info(f"Updated subscription {self.name} to paid status")
         else:
             reason = "not all invoices are paid" if not all_paid else f"subscription state is '{self.state}' (not 'confirmed')"
-            message = f"Cannot update to 'Paid' status because {reason}.\n\n" + "\n".join(payment_info)
+            summary = f"Cannot update to 'Paid' status because {reason}."
+        
+        # Per-invoice lines are only formatted for the notification itself
+        payment_info = "\n".join(f"Invoice {row['name']}: {row['payment_state']}" for row in rows)
+        message = f"{summary}\n\n{payment_info}"
         
         return {
             'type': 'ir.actions.client',
@@ -941,6 +974,11 @@ class ChildSubscription(models.Model):
         # Check if POS order already exists for this subscription to avoid duplicates
         if self.pos_order_id:
             return self.pos_order_id
+        
+        # Row-lock the subscription before creating anything: a concurrent submission
+        # that already updated it makes this fail with a serialization error, and the
+        # retried request then sees its pos_order_id above
+        self.env.cr.execute("SELECT id FROM kids_child_subscription WHERE id = %s FOR UPDATE", [self.id])
             
         # Ensure POS session exists
         if not pos_config.current_session_id:
@@ -969,41 +1007,54 @@ class ChildSubscription(models.Model):
         # Add order lines for each package
         total_amount = 0.0
         total_tax = 0.0
+        line_vals_list = []
+        company = pos_config.company_id
+        currency = pos_config.currency_id
+        child_name = self.child_id.name
+        PosOrderLine = self.env['pos.order.line']
+        tax_cache = {}
         
         for package in packages:
             if package.linked_product_id:
                 product = package.linked_product_id
                 
                 # Calculate taxes properly
-                taxes = product.taxes_id.filtered(lambda t: t.company_id == pos_config.company_id)
+                taxes = product.taxes_id.filtered(lambda t: t.company_id == company)
                 price_unit = package.price
                 
-                # Compute tax amount
-                tax_results = taxes.compute_all(
-                    price_unit, 
-                    currency=pos_config.currency_id,
-                    quantity=1,
-                    product=product,
-                    partner=customer
-                )
+                # Compute tax amount once per identical (taxes, price, product)
+                tax_key = (tuple(sorted(taxes.ids)), price_unit, product.id)
+                if tax_key not in tax_cache:
+                    tax_cache[tax_key] = taxes.compute_all(
+                        price_unit, 
+                        currency=currency,
+                        quantity=1,
+                        product=product,
+                        partner=customer
+                    )
+                tax_results = tax_cache[tax_key]
                 
                 line_tax = tax_results['total_included'] - tax_results['total_excluded']
                 
-                # Create POS order line with proper tax computation
-                self.env['pos.order.line'].create({
+                # POS order line with proper tax computation
+                line_vals_list.append({
                     'order_id': pos_order.id,
                     'product_id': product.id,
                     'qty': 1,
                     'price_unit': price_unit,
                     'price_subtotal': tax_results['total_excluded'],
                     'price_subtotal_incl': tax_results['total_included'],
-                    'full_product_name': f"{package.name} - {self.child_id.name}",
+                    'full_product_name': f"{package.name} - {child_name}",
                     'tax_ids': [(6, 0, taxes.ids)],
                 })
                 
                 total_amount += tax_results['total_included']
                 total_tax += line_tax
         
+        # Create all order lines in one batch
+        if line_vals_list:
+            PosOrderLine.create(line_vals_list)
+        
         # Update POS order with computed totals
         pos_order.write({
             'amount_tax': total_tax,
@@ -1100,49 +1151,74 @@ class ChildSubscription(models.Model):
                 'target': 'current',
             }
     
+    def _apply_state_update(self, updated_ids):
+        """Sync the ORM after a raw SQL state UPDATE on the given subscription ids"""
+        subscriptions = self.browse(updated_ids)
+        if subscriptions:
+            self.env['kids.child.checkin']._clear_validation_cache()
+            subscriptions.invalidate_recordset(['state', 'write_date', 'write_uid'])
+            # Stored computes such as is_active and kids.child current subscription depend on state
+            subscriptions.modified(['state'])
+        return subscriptions
+    
     def _activate_paid_subscriptions(self):
         """Activate subscriptions that are paid and within date range"""
-        today = fields.Date.today()
-        paid_subscriptions = self.search([
-            ('state', '=', 'paid'),
-            ('start_date', '<=', today)
-        ])
-        paid_subscriptions.write({'state': 'active'})
+        self.flush_model(['state', 'start_date'])
+        self.env.cr.execute("""
+            UPDATE kids_child_subscription
+               SET state = 'active', write_date = now() AT TIME ZONE 'UTC', write_uid = %s
+             WHERE state = 'paid' AND start_date <= %s
+         RETURNING id
+        """, [self.env.uid, fields.Date.today()])
+        return self._apply_state_update([row[0] for row in self.env.cr.fetchall()])
     
     @api.model
     def _cron_update_subscription_status(self):
         """Cron job to update subscription status based on dates and payments"""
         today = fields.Date.today()
         
-        # Update payment status for all confirmed subscriptions
-        confirmed_subscriptions = self.search([('state', 'in', ['confirmed', 'paid'])])
-
+        # Move confirmed subscriptions whose posted invoices are all paid to 'paid'
+        confirmed_subscriptions = self.search([('state', '=', 'confirmed')])
+        # Load invoices and their payment state for the whole batch in one go
+        invoices = confirmed_subscriptions.mapped('invoice_ids')
+        if invoices:
+            invoices.read(['state', 'payment_state'])
+        
+        def _invoices_paid(subscription):
+            posted = subscription.invoice_ids.filtered(lambda inv: inv.state == 'posted')
+            return bool(posted) and all(inv.payment_state == 'paid' for inv in posted)
+        
+        paid_subscriptions = confirmed_subscriptions.filtered(_invoices_paid)
+        if paid_subscriptions:
+            paid_subscriptions.with_context(**NO_TRACKING_CONTEXT).write({
+                'state': 'paid',
+                'activation_date': fields.Datetime.now()
+            })
         
         # Activate paid subscriptions that should be active
         self._activate_paid_subscriptions()
         
         # Expire subscriptions that have passed end date
-        active_subscriptions = self.search([
-            ('state', '=', 'active'),
-            ('end_date', '<', today)
-        ])
-        active_subscriptions.write({'state': 'expired'})
+        self.flush_model(['state', 'end_date'])
+        self.env.cr.execute("""
+            UPDATE kids_child_subscription
+               SET state = 'expired', write_date = now() AT TIME ZONE 'UTC', write_uid = %s
+             WHERE state = 'active' AND end_date < %s
+         RETURNING id
+        """, [self.env.uid, today])
+        self._apply_state_update([row[0] for row in self.env.cr.fetchall()])
     
     @api.model
     def fix_currency_references(self):
         """Fix any existing records with invalid currency references"""
-        # Find subscriptions with invalid or missing currency_id
-        subscriptions = self.search([('currency_id', '=', False)])
-        if subscriptions:
-            default_currency = self._get_default_currency()
-            subscriptions.write({'currency_id': default_currency})
-        
-        # Also fix any records that might have invalid currency references
-        all_subscriptions = self.search([])
-        for subscription in all_subscriptions:
-            try:
-                # Try to access the currency_id to see if it's valid
-                _ = subscription.currency_id.name
-            except Exception:
-                # If there's an error, fix it with default currency
-                subscription.currency_id = self._get_default_currency()
+        # Find subscriptions with a missing or dangling currency_id in one query
+        self.flush_model(['currency_id'])
+        self.env.cr.execute("""
+            SELECT s.id
+              FROM kids_child_subscription s
+         LEFT JOIN res_currency c ON c.id = s.currency_id
+             WHERE s.currency_id IS NULL OR c.id IS NULL
+        """)
+        bad_ids = [row[0] for row in self.env.cr.fetchall()]
+        if bad_ids:
+            self.browse(bad_ids).write({'currency_id': self._get_default_currency()})
@@ -0,0 +1,18 @@
+from odoo import models
+
+
+class PosOrder(models.Model):
+    _inherit = 'pos.order'
+    
+    def write(self, vals):
+        """Override write to move linked kids subscriptions to 'paid' when the order is paid"""
+        result = super().write(vals)
+        
+        if 'state' in vals or 'account_move' in vals:
+            subscriptions = self.env['kids.child.subscription'].search([
+                ('pos_order_id', 'in', self.ids),
+                ('state', '=', 'confirmed')
+            ])
+            subscriptions._sync_state_from_payment()
+        
+        return result
@@ -34,8 +34,12 @@ class ResPartner(models.Model):
     @api.depends('children_ids')
     def _compute_children_count(self):
         """Compute the number of children for each parent"""
+        groups = self.env['kids.child'].read_group(
+            [('parent_id', 'in', self._origin.ids)], ['parent_id'], ['parent_id']
+        )
+        counts = {group['parent_id'][0]: group['parent_id_count'] for group in groups}
         for record in self:
-            record.children_count = len(record.children_ids)
+            record.children_count = counts.get(record._origin.id, 0)
     
     def action_view_children(self):
         """Action to view children of this parent"""
@@ -56,9 +60,7 @@ class ResPartner(models.Model):
     def action_view_subscriptions(self):
         """Action to view subscriptions for this parent's children"""
         self.ensure_one()
-        subscription_ids = []
-        for child in self.children_ids:
-            subscription_ids.extend(child.subscription_ids.ids)
+        subscription_ids = self.children_ids.mapped('subscription_ids').ids
         
         return {
             'type': 'ir.actions.act_window',
@@ -74,7 +76,7 @@ class ResPartner(models.Model):
         self.ensure_one()
         
         # Get active children (not already checked in)
-        active_children = self.children_ids.filtered(lambda c: not c.is_checked_in and c.active)
+        active_children = self.children_ids.filtered_domain([('is_checked_in', '=', False), ('active', '=', True)])
         
         if not active_children:
             return {
@@ -129,9 +131,17 @@ class ResPartner(models.Model):
     def write(self, vals):
         """Override write to update is_kids_club_parent status"""
         result = super(ResPartner, self).write(vals)
-        for partner in self:
-            if partner.children_ids and not partner.is_kids_club_parent:
-                partner.is_kids_club_parent = True
-            elif not partner.children_ids and partner.is_kids_club_parent:
-                partner.is_kids_club_parent = False
+        if 'children_ids' in vals or 'is_kids_club_parent' in vals:
+            self._sync_kids_club_parent()
         return result
+    
+    def _sync_kids_club_parent(self):
+        """Set is_kids_club_parent from whether the partner has active children"""
+        # Children are usually linked through kids.child.parent_id, not a partner write
+        self.invalidate_recordset(['children_ids'])
+        to_true = self.filtered(lambda p: p.children_ids and not p.is_kids_club_parent)
+        to_false = self.filtered(lambda p: not p.children_ids and p.is_kids_club_parent)
+        if to_true:
+            to_true.write({'is_kids_club_parent': True})
+        if to_false:
+            to_false.write({'is_kids_club_parent': False})
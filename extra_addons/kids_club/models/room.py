@@ -7,6 +7,11 @@ class KidsRoom(models.Model):
     _description = 'Kids Club Room'
     _inherit = ['mail.thread', 'mail.activity.mixin']
     _order = 'room_number, name'
+    
+    _sql_constraints = [
+        ('unique_room_number_active', 'EXCLUDE (room_number WITH =) WHERE (active)',
+         'Room number must be unique among active rooms.'),
+    ]
 
     name = fields.Char('Room Name', required=True, help="Name of the room (e.g., Play Area, Art Room)")
     room_number = fields.Char('Room Number', required=True, help="Room number or identifier")
@@ -15,37 +20,35 @@ class KidsRoom(models.Model):
     capacity = fields.Integer('Capacity', required=True, default=10,
                              help="Maximum number of children allowed in this room")
     
+    checkin_ids = fields.One2many('kids.child.checkin', 'room_id', string='Check-ins')
+    
     # Computed fields for current status
-    current_checkins = fields.Integer('Current Check-ins', compute='_compute_current_checkins',
+    current_checkins = fields.Integer('Current Check-ins', compute='_compute_current_checkins', store=True,
                                      help="Number of children currently checked in to this room")
-    available_spots = fields.Integer('Available Spots', compute='_compute_available_spots',
+    available_spots = fields.Integer('Available Spots', compute='_compute_spots', store=True,
                                     help="Number of available spots remaining")
-    is_full = fields.Boolean('Room Full', compute='_compute_is_full',
+    is_full = fields.Boolean('Room Full', compute='_compute_spots', store=True,
                             help="True if room is at capacity")
     
     # Active field for archiving rooms
     active = fields.Boolean('Active', default=True)
     
-    @api.depends('capacity')
+    @api.depends('checkin_ids.state', 'checkin_ids.room_id')
     def _compute_current_checkins(self):
         """Compute current number of checked-in children in this room"""
+        groups = self.env['kids.child.checkin'].read_group([
+            ('room_id', 'in', self._origin.ids),
+            ('state', '=', 'checked_in')
+        ], ['room_id'], ['room_id'])
+        counts = {group['room_id'][0]: group['room_id_count'] for group in groups}
         for room in self:
-            checkins = self.env['kids.child.checkin'].search_count([
-                ('room_id', '=', room.id),
-                ('state', '=', 'checked_in')
-            ])
-            room.current_checkins = checkins
+            room.current_checkins = counts.get(room._origin.id, 0)
     
     @api.depends('capacity', 'current_checkins')
-    def _compute_available_spots(self):
-        """Compute available spots in the room"""
+    def _compute_spots(self):
+        """Compute available spots and whether the room is at full capacity"""
         for room in self:
             room.available_spots = room.capacity - room.current_checkins
-    
-    @api.depends('current_checkins', 'capacity')
-    def _compute_is_full(self):
-        """Check if room is at full capacity"""
-        for room in self:
             room.is_full = room.current_checkins >= room.capacity
     
     @api.constrains('capacity')
@@ -55,19 +58,6 @@ class KidsRoom(models.Model):
             if room.capacity <= 0:
                 raise ValidationError("Room capacity must be greater than 0.")
     
-    @api.constrains('room_number')
-    def _check_unique_room_number(self):
-        """Ensure room numbers are unique"""
-        for room in self:
-            if room.room_number:
-                existing = self.search([
-                    ('room_number', '=', room.room_number),
-                    ('id', '!=', room.id),
-                    ('active', '=', True)
-                ])
-                if existing:
-                    raise ValidationError(f"Room number '{room.room_number}' already exists.")
-    
     def name_get(self):
         """Custom display name for room selection"""
         result = []
@@ -89,5 +79,5 @@ class KidsRoom(models.Model):
         """Get all rooms with available capacity"""
         return self.search([
             ('active', '=', True),
-            ('current_checkins', '<', self.capacity)
+            ('is_full', '=', False)
         ])
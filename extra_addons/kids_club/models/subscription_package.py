@@ -1,12 +1,28 @@
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError
 
+# Validity in days for the fixed validity periods ('custom' uses custom_validity_days)
+_VALIDITY_DAYS = {'weekly': 7, 'monthly': 30, 'yearly': 365}
+
 
 class SubscriptionPackage(models.Model):
     _name = 'subscription.package'
     _description = 'Subscription Package'
     _order = 'name'
     _inherit = ['mail.thread', 'mail.activity.mixin']
+    
+    _sql_constraints = [
+        ('price_positive', 'CHECK (price > 0)',
+         'Package price must be greater than zero.'),
+        ('visits_positive', 'CHECK (number_of_visits > 0)',
+         'Number of visits must be greater than zero.'),
+        ('daily_free_minutes_nonneg', 'CHECK (daily_free_minutes >= 0)',
+         'Daily free minutes cannot be negative.'),
+        ('margin_minutes_nonneg', 'CHECK (margin_minutes >= 0)',
+         'Margin minutes cannot be negative.'),
+        ('extra_charge_nonneg', 'CHECK (extra_time_charge_per_minute >= 0)',
+         'Extra time charge per minute cannot be negative.'),
+    ]
 
     name = fields.Char(
         string='Package Name (English)',
@@ -34,6 +50,13 @@ class SubscriptionPackage(models.Model):
         help='Currency for the package price'
     )
     
+    service_category_id = fields.Many2one(
+        'product.category',
+        string='Product Category',
+        default=lambda self: self._get_cached_service_category_id(),
+        help='Category used for the linked service product'
+    )
+    
     linked_product_id = fields.Many2one(
         'product.product',
         string='Linked Product',
@@ -123,57 +146,64 @@ class SubscriptionPackage(models.Model):
         help='Charge per minute for time beyond daily free minutes + margin minutes'
     )
 
-    @api.model
-    def create(self, vals):
+    @api.model_create_multi
+    def create(self, vals_list):
         """Override create to automatically generate linked service product"""
-        # Create the package first
-        package = super().create(vals)
+        # Create the packages first
+        packages = super().create(vals_list)
+        
+        # The category normally comes from the field default; fall back to the cached id
+        categ_id = None
+        if any(not package.service_category_id for package in packages):
+            categ_id = self._get_cached_service_category_id()
         
-        # Create the linked service product
-        product_vals = {
+        # Create the linked service products in one batch
+        products = self.env['product.product'].create([{
             'name': package.name,
             'type': 'service',
             'list_price': package.price,
             'sale_ok': True,
             'purchase_ok': False,
-            'categ_id': self._get_service_category_id(),
-        }
-        
-        product = self.env['product.product'].create(product_vals)
+            'categ_id': package.service_category_id.id or categ_id,
+        } for package in packages])
         
-        # Link the product to the package
-        package.linked_product_id = product.id
+        # Link each product to its package
+        for package, product in zip(packages, products):
+            package.linked_product_id = product.id
         
-        return package
+        return packages
 
     def write(self, vals):
         """Override write to sync changes with linked product"""
         result = super().write(vals)
+        if not {'name', 'price', 'active'} & vals.keys():
+            return result
         
-        # Check if name or price changed
-        if 'name' in vals or 'price' in vals:
-            for package in self:
-                if package.linked_product_id:
-                    product_vals = {}
-                    if 'name' in vals:
-                        product_vals['name'] = package.name
-                    if 'price' in vals:
-                        product_vals['list_price'] = package.price
-                    
-                    package.linked_product_id.write(product_vals)
+        # Check if name or price changed; vals apply to every package alike,
+        # so the linked products can be updated with a single write
+        product_vals = {}
+        if 'name' in vals:
+            product_vals['name'] = vals['name']
+        if 'price' in vals:
+            product_vals['list_price'] = vals['price']
         
         # Handle active/inactive sync
         if 'active' in vals:
-            for package in self:
-                if package.linked_product_id:
-                    package.linked_product_id.active = package.active
+            product_vals['active'] = vals['active']
+        
+        # Only touch products whose values actually differ (product writes are costly)
+        products = self.mapped('linked_product_id').filtered(
+            lambda p: any(p[fname] != value for fname, value in product_vals.items())
+        )
+        if products:
+            products.write(product_vals)
         
         return result
 
     def unlink(self):
         """Override unlink to delete linked products"""
         # Store linked products before deletion
-        linked_products = self.mapped('linked_product_id').filtered(lambda p: p.exists())
+        linked_products = self.mapped('linked_product_id')
         
         # Delete the packages
         result = super().unlink()
@@ -186,46 +216,49 @@ class SubscriptionPackage(models.Model):
 
     def toggle_active(self):
         """Toggle active state and sync with linked product"""
-        for package in self:
-            package.active = not package.active
-            if package.linked_product_id:
-                package.linked_product_id.active = package.active
+        # write() propagates 'active' to the linked products of each batch
+        active_packages = self.filtered('active')
+        inactive_packages = self - active_packages
+        if active_packages:
+            active_packages.write({'active': False})
+        if inactive_packages:
+            inactive_packages.write({'active': True})
+
+    def _get_cached_service_category_id(self):
+        """Return the service category id, cached on the registry across calls"""
+        categ_id = getattr(self.env.registry, '_kids_subscription_categ_id', None)
+        # The cache outlives transactions: the category may have been rolled back or deleted
+        if not categ_id or not self.env['product.category'].browse(categ_id).exists():
+            categ_id = self._get_service_category_id()
+            self.env.registry._kids_subscription_categ_id = categ_id
+        return categ_id
 
     def _get_service_category_id(self):
         """Get or create a service category for subscription packages"""
-        category = self.env['product.category'].search([
-            ('name', '=', 'Subscription Services')
-        ], limit=1)
-        
-        if not category:
-            category = self.env['product.category'].create({
-                'name': 'Subscription Services',
-                'parent_id': False,
-            })
+        # Plain id lookup: no domain parsing or record rules needed
+        self.env['product.category'].flush_model(['name'])
+        self.env.cr.execute(
+            "SELECT id FROM product_category WHERE name = %s ORDER BY id LIMIT 1",
+            ['Subscription Services']
+        )
+        row = self.env.cr.fetchone()
+        if row:
+            return row[0]
         
+        category = self.env['product.category'].create({
+            'name': 'Subscription Services',
+            'parent_id': False,
+        })
         return category.id
 
-    @api.constrains('price')
-    def _check_price(self):
-        """Validate that price is positive"""
-        for package in self:
-            if package.price <= 0:
-                raise ValidationError("Package price must be greater than zero.")
-
     @api.depends('validity_period', 'custom_validity_days')
     def _compute_validity_days(self):
         """Compute the number of validity days based on selected period"""
         for package in self:
-            if package.validity_period == 'weekly':
-                package.validity_days = 7
-            elif package.validity_period == 'monthly':
-                package.validity_days = 30
-            elif package.validity_period == 'yearly':
-                package.validity_days = 365
-            elif package.validity_period == 'custom':
+            if package.validity_period == 'custom':
                 package.validity_days = package.custom_validity_days or 30
             else:
-                package.validity_days = 30  # Default fallback
+                package.validity_days = _VALIDITY_DAYS.get(package.validity_period, 30)  # Default fallback
 
     @api.constrains('name')
     def _check_name(self):
@@ -241,29 +274,6 @@ class SubscriptionPackage(models.Model):
             if package.validity_period == 'custom' and package.custom_validity_days <= 0:
                 raise ValidationError("Custom validity days must be greater than zero.")
     
-    @api.constrains('number_of_visits')
-    def _check_visits(self):
-        """Validate that number of visits is positive"""
-        for package in self:
-            if package.number_of_visits <= 0:
-                raise ValidationError("Number of visits must be greater than zero.")
-    
-    @api.constrains('daily_free_minutes', 'margin_minutes')
-    def _check_minutes(self):
-        """Validate that time fields are non-negative"""
-        for package in self:
-            if package.daily_free_minutes < 0:
-                raise ValidationError("Daily free minutes cannot be negative.")
-            if package.margin_minutes < 0:
-                raise ValidationError("Margin minutes cannot be negative.")
-    
-    @api.constrains('extra_time_charge_per_minute')
-    def _check_extra_time_charge(self):
-        """Validate that extra time charge per minute is non-negative"""
-        for package in self:
-            if package.extra_time_charge_per_minute < 0:
-                raise ValidationError("Extra time charge per minute cannot be negative.")
-
     def action_view_linked_product(self):
         """Action to view the linked product"""
         self.ensure_one()
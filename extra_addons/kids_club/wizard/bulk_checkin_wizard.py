@@ -30,8 +30,11 @@ class BulkCheckinWizard(models.TransientModel):
             res['child_ids'] = self.env.context['default_child_ids']
         elif self.env.context.get('active_ids'):
             # Filter only eligible children (active and not checked in)
-            active_children = self.env['kids.child'].browse(self.env.context['active_ids'])
-            eligible_children = active_children.filtered(lambda c: not c.is_checked_in and c.active)
+            eligible_children = self.env['kids.child'].search([
+                ('id', 'in', self.env.context['active_ids']),
+                ('is_checked_in', '=', False),
+                ('active', '=', True)
+            ])
             res['child_ids'] = [(6, 0, eligible_children.ids)]
             
         return res
@@ -42,33 +45,32 @@ class BulkCheckinWizard(models.TransientModel):
             raise ValidationError("Please select at least one child to check-in.")
         
         # Filter only eligible children
-        eligible_children = self.child_ids.filtered(lambda c: not c.is_checked_in and c.active)
+        eligible_children = self.child_ids.filtered_domain([('is_checked_in', '=', False), ('active', '=', True)])
         
         if not eligible_children:
             raise ValidationError("No eligible children selected. Children must be active and not already checked in.")
         
-        # Create check-in records for all eligible children
-        checkin_records = []
-        for child in eligible_children:
-            # Check if child has active subscription
-            if not child.current_subscription_id or not child.current_subscription_id.is_active:
-                continue  # Skip children without active subscriptions
-                
-            checkin_vals = {
-                'child_id': child.id,
-                'checkin_time': self.checkin_time,
-                'notes': self.notes or '',
-                'state': 'checked_in',
-            }
-            checkin_record = self.env['kids.child.checkin'].create(checkin_vals)
-            checkin_records.append(checkin_record)
+        # Load every child's current subscription in one batch, then keep the active ones
+        eligible_children.current_subscription_id.read(['is_active'])
+        subscribed_children = eligible_children.filtered(lambda c: c.current_subscription_id.is_active)
         
-        if not checkin_records:
+        if not subscribed_children:
             raise ValidationError("No children could be checked in. Please ensure they have active subscriptions.")
         
+        # Create check-in records for all eligible children with an active subscription
+        checkin_time = self.checkin_time
+        notes = self.notes or ''
+        vals_list = [{
+            'child_id': child.id,
+            'checkin_time': checkin_time,
+            'notes': notes,
+            'state': 'checked_in',
+        } for child in subscribed_children]
+        checkin_records = self.env['kids.child.checkin'].create(vals_list)
+        
         # Show success notification
-        message = f"Successfully checked in {len(checkin_records)} children:\n"
-        message += "\n".join([f"• {record.child_id.name}" for record in checkin_records])
+        names = checkin_records.mapped('child_id.name')
+        message = f"Successfully checked in {len(checkin_records)} children:\n" + "\n".join(f"• {name}" for name in names)
         
         return {
             'type': 'ir.actions.client',
@@ -1,10 +1,34 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from ..models.checkin import _mask_otp
+
+# Static part of the action that reopens the check-in wizard on its own record
+_RELOAD_CHECKIN = {
+    'type': 'ir.actions.act_window',
+    'name': 'Quick Check-in/Check-out',
+    'res_model': 'kids.checkin.wizard',
+    'view_mode': 'form',
+    'target': 'new',
+}
+
+# Context keys carried over when a wizard reopens itself
+CTX_KEEP = ('default_child_id', 'lang', 'tz', 'uid')
+
+
+def _reload_context(context):
+    """Return the minimal context a reopened wizard needs"""
+    return {key: context[key] for key in CTX_KEEP if key in context}
 
 
 class CheckinWizard(models.TransientModel):
     _name = 'kids.checkin.wizard'
     _description = 'Quick Check-in Wizard'
+    # Wizards are reopened on every OTP step; keep the transient table small
+    _transient_max_hours = 0.5
+    _transient_max_count = 200
+    
+    # Shortest barcode worth looking up; shorter input is a partial scanner read
+    MIN_BARCODE_LEN = 4
     
     child_id = fields.Many2one('kids.child', string='Child', required=True)
     room_id = fields.Many2one('kids.room', string='Room', 
@@ -20,40 +44,36 @@ class CheckinWizard(models.TransientModel):
         if child_id:
             res['child_id'] = child_id
             
-            # Check for existing check-in record and set appropriate state
-            existing_checkin = self.env['kids.child.checkin'].search([
-                ('child_id', '=', child_id),
-                ('state', 'in', ['pending_otp', 'checked_in', 'pending_checkout_otp'])
-            ], limit=1)
+            # One lookup for the open check-in, or the subscription validation if there is none
+            wizard_state = self.env['kids.child.checkin']._fetch_wizard_state(child_id)
             
-            if existing_checkin:
-                res['checkin_id'] = existing_checkin.id
-                res['current_state'] = existing_checkin.state
+            if wizard_state['checkin_id']:
+                res['checkin_id'] = wizard_state['checkin_id']
+                res['current_state'] = wizard_state['state']
                 
-                if existing_checkin.state == 'pending_otp':
+                if wizard_state['state'] == 'pending_otp':
                     res['otp_sent'] = True
-                    res['sent_otp_code'] = existing_checkin.otp_code
-                elif existing_checkin.state == 'pending_checkout_otp':
+                    res['sent_otp_code'] = _mask_otp(wizard_state['otp_last2'])
+                elif wizard_state['state'] == 'pending_checkout_otp':
                     res['checkout_otp_sent'] = True
-                    res['sent_checkout_otp_code'] = existing_checkin.checkout_otp_code
+                    res['sent_checkout_otp_code'] = _mask_otp(wizard_state['checkout_otp_last2'])
                 
                 # Set subscription info if available
-                if existing_checkin.subscription_id:
-                    res['subscription_id'] = existing_checkin.subscription_id.id
-                    res['remaining_visits'] = existing_checkin.subscription_id.remaining_visits
+                if wizard_state['subscription_id']:
+                    res['subscription_id'] = wizard_state['subscription_id']
+                    res['remaining_visits'] = wizard_state['remaining_visits']
                     
-                if existing_checkin.state in ['checked_in', 'pending_checkout_otp']:
+                if wizard_state['state'] in ['checked_in', 'pending_checkout_otp']:
                     res['validation_message'] = "Child is already checked in"
             else:
                 res['current_state'] = 'new'
                 
                 # Validate subscription for new check-ins
-                validation = self.env['kids.child.checkin'].validate_active_subscription(child_id)
-                if validation['valid']:
-                    res['subscription_id'] = validation['subscription'].id
-                    res['remaining_visits'] = validation['subscription'].remaining_visits
+                if wizard_state['valid']:
+                    res['subscription_id'] = wizard_state['subscription_id']
+                    res['remaining_visits'] = wizard_state['remaining_visits']
                 else:
-                    res['validation_message'] = validation['message']
+                    res['validation_message'] = wizard_state['message']
         
         return res
     barcode_scan = fields.Char('Scan Barcode', help='Scan or enter child barcode')
@@ -66,12 +86,12 @@ class CheckinWizard(models.TransientModel):
     # OTP fields
     otp_sent = fields.Boolean('OTP Sent', default=False)
     otp_code = fields.Char('Enter OTP', size=6)
-    sent_otp_code = fields.Char('Sent OTP Code', readonly=True, help='OTP code that was sent (for testing)')
+    sent_otp_code = fields.Char('Sent OTP (masked)', readonly=True, help='Last two digits of the OTP that was sent')
     
     # Checkout OTP fields
     checkout_otp_sent = fields.Boolean('Checkout OTP Sent', default=False)
     checkout_otp_code = fields.Char('Enter Checkout OTP', size=6)
-    sent_checkout_otp_code = fields.Char('Sent Checkout OTP Code', readonly=True, help='Checkout OTP code that was sent (for testing)')
+    sent_checkout_otp_code = fields.Char('Sent Checkout OTP (masked)', readonly=True, help='Last two digits of the checkout OTP that was sent')
     
     # Internal fields
     checkin_id = fields.Many2one('kids.child.checkin', string='Check-in Record')
@@ -86,77 +106,80 @@ class CheckinWizard(models.TransientModel):
     @api.onchange('barcode_scan')
     def _onchange_barcode_scan(self):
         """Auto-select child based on barcode scan"""
-        if self.barcode_scan:
-            child = self.env['kids.child'].search([
-                ('barcode_id', '=', self.barcode_scan.strip())
-            ], limit=1)
-            
-            if child:
-                self.child_id = child
-                self.barcode_scan = False  # Clear the field after successful scan
-            else:
-                return {
-                    'warning': {
-                        'title': 'Barcode Not Found',
-                        'message': f'No child found with barcode: {self.barcode_scan}'
-                    }
+        code = (self.barcode_scan or '').strip()
+        # Skip partial scans without querying the database
+        if len(code) < self.MIN_BARCODE_LEN:
+            return
+        
+        # Barcodes are alphanumeric: anything else cannot match, so skip the lookup
+        child = self.env['kids.child'].search([
+            ('barcode_id', '=', code)
+        ], limit=1) if code.isalnum() else False
+        
+        if child:
+            self.child_id = child
+            self.barcode_scan = False  # Clear the field after successful scan
+        else:
+            return {
+                'warning': {
+                    'title': 'Barcode Not Found',
+                    'message': f'No child found with barcode: {code}'
                 }
+            }
     
     @api.onchange('child_id')
     def _onchange_child_id(self):
         """Validate child subscription when child is selected"""
-        if self.child_id:
-            # Check for existing check-in record
-            existing_checkin = self.env['kids.child.checkin'].search([
-                ('child_id', '=', self.child_id.id),
-                ('state', 'in', ['pending_otp', 'checked_in', 'pending_checkout_otp'])
-            ], limit=1)
-            
-            if existing_checkin:
-                self.checkin_id = existing_checkin
-                self.current_state = existing_checkin.state
-                if existing_checkin.state == 'pending_otp':
-                    self.otp_sent = True
-                    # Populate sent OTP code for display
-                    self.sent_otp_code = existing_checkin.otp_code
-                elif existing_checkin.state == 'pending_checkout_otp':
-                    self.checkout_otp_sent = True
-                    # Populate sent checkout OTP code for display
-                    self.sent_checkout_otp_code = existing_checkin.checkout_otp_code
-            else:
-                self.checkin_id = False
-                self.current_state = 'new'
-                self.otp_sent = False
-                self.checkout_otp_sent = False
-            
-            validation = self.env['kids.child.checkin'].validate_active_subscription(self.child_id.id)
-            
-            if validation['valid']:
-                self.subscription_id = validation['subscription']
-                self.remaining_visits = validation['subscription'].remaining_visits
-                # Only show validation message if there's no existing check-in (to avoid confusion)
-                if not existing_checkin:
-                    self.validation_message = False
-            else:
-                # Only clear subscription fields if there's no existing check-in
-                if not existing_checkin:
-                    self.subscription_id = False
-                    self.remaining_visits = 0
-                    self.validation_message = validation['message']
-                else:
-                    # For existing check-ins, try to get subscription from the check-in record
-                    if existing_checkin.subscription_id:
-                        self.subscription_id = existing_checkin.subscription_id
-                        self.remaining_visits = existing_checkin.subscription_id.remaining_visits
-                    self.validation_message = "Child is already checked in"
+        # Collect all field values and apply them in one update
+        if not self.child_id:
+            self.update({
+                'subscription_id': False,
+                'remaining_visits': 0,
+                'validation_message': False,
+                'checkin_id': False,
+                'current_state': 'new',
+                'otp_sent': False,
+                'checkout_otp_sent': False,
+            })
+            return
+        
+        # Check for existing check-in record (falls back to subscription validation)
+        wizard_state = self.env['kids.child.checkin']._fetch_wizard_state(self.child_id.id)
+        existing_checkin = wizard_state['checkin_id']
+        
+        if existing_checkin:
+            # The open check-in already carries its subscription, no validation needed
+            vals = {
+                'checkin_id': existing_checkin,
+                'current_state': wizard_state['state'],
+                'validation_message': False,
+            }
+            if wizard_state['state'] == 'pending_otp':
+                # Populate sent OTP code for display
+                vals.update(otp_sent=True, sent_otp_code=_mask_otp(wizard_state['otp_last2']))
+            elif wizard_state['state'] == 'pending_checkout_otp':
+                # Populate sent checkout OTP code for display
+                vals.update(checkout_otp_sent=True, sent_checkout_otp_code=_mask_otp(wizard_state['checkout_otp_last2']))
+            if wizard_state['subscription_id']:
+                vals['subscription_id'] = wizard_state['subscription_id']
+                vals['remaining_visits'] = wizard_state['remaining_visits']
+            if wizard_state['state'] in ['checked_in', 'pending_checkout_otp']:
+                vals['validation_message'] = "Child is already checked in"
         else:
-            self.subscription_id = False
-            self.remaining_visits = 0
-            self.validation_message = False
-            self.checkin_id = False
-            self.current_state = 'new'
-            self.otp_sent = False
-            self.checkout_otp_sent = False
+            vals = {
+                'checkin_id': False,
+                'current_state': 'new',
+                'otp_sent': False,
+                'checkout_otp_sent': False,
+            }
+            if wizard_state['valid']:
+                vals.update(subscription_id=wizard_state['subscription_id'],
+                            remaining_visits=wizard_state['remaining_visits'],
+                            validation_message=False)
+            else:
+                vals.update(subscription_id=False, remaining_visits=0, validation_message=wizard_state['message'])
+        
+        self.update(vals)
     
     def action_send_otp(self):
         """Send OTP for check-in verification"""
@@ -178,18 +201,8 @@ class CheckinWizard(models.TransientModel):
             # Just refresh the wizard to show existing OTP input
             self.otp_sent = True
             self.current_state = 'pending_otp'
-            self.sent_otp_code = self.checkin_id.otp_code
-            # Trigger onchange to repopulate subscription fields
-            self._onchange_child_id()
-            return {
-                'type': 'ir.actions.act_window',
-                'name': 'Quick Check-in/Check-out',
-                'res_model': 'kids.checkin.wizard',
-                'res_id': self.id,
-                'view_mode': 'form',
-                'target': 'new',
-                'context': self.env.context,
-            }
+            self.sent_otp_code = _mask_otp(self.checkin_id.otp_last2)
+            return {**_RELOAD_CHECKIN, 'res_id': self.id, 'context': _reload_context(self.env.context)}
         
         # Create check-in record and send OTP
         checkin = self.env['kids.child.checkin'].create_checkin_request(self.child_id.id, self.room_id.id if self.room_id else None)
@@ -198,21 +211,10 @@ class CheckinWizard(models.TransientModel):
         self.otp_sent = True
         self.current_state = 'pending_otp'
         # Store the sent OTP code for display (testing purposes)
-        self.sent_otp_code = checkin.otp_code
-        
-        # Trigger onchange to repopulate subscription fields after wizard reload
-        self._onchange_child_id()
+        self.sent_otp_code = _mask_otp(checkin.otp_last2)
         
         # Return action to reload the wizard with updated state
-        return {
-            'type': 'ir.actions.act_window',
-            'name': 'Quick Check-in/Check-out',
-            'res_model': 'kids.checkin.wizard',
-            'res_id': self.id,
-            'view_mode': 'form',
-            'target': 'new',
-            'context': self.env.context,
-        }
+        return {**_RELOAD_CHECKIN, 'res_id': self.id, 'context': _reload_context(self.env.context)}
     
     def action_verify_checkin(self):
         """Verify OTP and complete check-in"""
@@ -224,9 +226,9 @@ class CheckinWizard(models.TransientModel):
         if not self.checkin_id:
             raise ValidationError("No check-in record found. Please send OTP first.")
         
-        # Verify OTP
+        # Verify OTP against the exact check-in the code was sent for
         try:
-            result = self.checkin_id.action_verify_otp(self.otp_code)
+            self.env['kids.child.checkin'].verify_checkin_request(self.checkin_id.id, self.otp_code)
             
             # Auto-close wizard after successful check-in
             return {
@@ -253,21 +255,10 @@ class CheckinWizard(models.TransientModel):
         self.checkout_otp_sent = True
         self.current_state = 'pending_checkout_otp'
         # Store the sent checkout OTP code for display (testing purposes)
-        self.sent_checkout_otp_code = self.checkin_id.checkout_otp_code
-        
-        # Trigger onchange to repopulate subscription fields after wizard reload
-        self._onchange_child_id()
+        self.sent_checkout_otp_code = _mask_otp(self.checkin_id.checkout_otp_last2)
         
         # Return action to reload the wizard with updated state
-        return {
-            'type': 'ir.actions.act_window',
-            'name': 'Quick Check-in/Check-out',
-            'res_model': 'kids.checkin.wizard',
-            'res_id': self.id,
-            'view_mode': 'form',
-            'target': 'new',
-            'context': self.env.context,
-        }
+        return {**_RELOAD_CHECKIN, 'res_id': self.id, 'context': _reload_context(self.env.context)}
     
     def action_verify_checkout(self):
         """Verify checkout OTP and complete check-out"""
@@ -301,20 +292,10 @@ class CheckinWizard(models.TransientModel):
         # Resend OTP
         result = self.checkin_id.action_resend_otp()
         self.otp_code = False  # Clear previous OTP entry
-        
-        # Trigger onchange to repopulate subscription fields after wizard reload
-        self._onchange_child_id()
+        self.sent_otp_code = _mask_otp(self.checkin_id.otp_last2)
         
         # Return action to reload the wizard with updated state
-        return {
-            'type': 'ir.actions.act_window',
-            'name': 'Quick Check-in/Check-out',
-            'res_model': 'kids.checkin.wizard',
-            'res_id': self.id,
-            'view_mode': 'form',
-            'target': 'new',
-            'context': self.env.context,
-        }
+        return {**_RELOAD_CHECKIN, 'res_id': self.id, 'context': _reload_context(self.env.context)}
     
     def action_resend_checkout_otp(self):
         """Resend checkout OTP"""
@@ -326,20 +307,10 @@ class CheckinWizard(models.TransientModel):
         # Resend checkout OTP
         result = self.checkin_id.action_resend_checkout_otp()
         self.checkout_otp_code = False  # Clear previous OTP entry
-        
-        # Trigger onchange to repopulate subscription fields after wizard reload
-        self._onchange_child_id()
+        self.sent_checkout_otp_code = _mask_otp(self.checkin_id.checkout_otp_last2)
         
         # Return action to reload the wizard with updated state
-        return {
-            'type': 'ir.actions.act_window',
-            'name': 'Quick Check-in/Check-out',
-            'res_model': 'kids.checkin.wizard',
-            'res_id': self.id,
-            'view_mode': 'form',
-            'target': 'new',
-            'context': self.env.context,
-        }
+        return {**_RELOAD_CHECKIN, 'res_id': self.id, 'context': _reload_context(self.env.context)}
 
     def action_direct_checkin(self):
         """Direct check-in without OTP verification"""
@@ -348,13 +319,13 @@ class CheckinWizard(models.TransientModel):
         if not self.child_id:
             raise ValidationError("Please select a child first.")
         
-        # Check if child is already checked in
-        existing_checkin = self.env['kids.child.checkin'].search([
+        # Check if child is already checked in (presence only, no record needed)
+        already_checked_in = self.env['kids.child.checkin'].search_count([
             ('child_id', '=', self.child_id.id),
             ('state', 'in', ['checked_in', 'pending_checkout_otp'])
         ], limit=1)
         
-        if existing_checkin:
+        if already_checked_in:
             raise ValidationError(f"{self.child_id.name} is already checked in.")
         
         # Validate subscription
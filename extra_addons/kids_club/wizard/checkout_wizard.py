@@ -1,10 +1,24 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from ..models.checkin import _mask_otp
+from .checkin_wizard import _reload_context
+
+# Static part of the action that reopens the checkout wizard on its own record
+_RELOAD_CHECKOUT = {
+    'type': 'ir.actions.act_window',
+    'name': 'Checkout - Enter OTP',
+    'res_model': 'kids.checkout.wizard',
+    'view_mode': 'form',
+    'target': 'new',
+}
 
 
 class CheckoutWizard(models.TransientModel):
     _name = 'kids.checkout.wizard'
     _description = 'Simple Checkout Wizard'
+    # Wizards are reopened on every OTP step; keep the transient table small
+    _transient_max_hours = 0.5
+    _transient_max_count = 200
     
     child_id = fields.Many2one('kids.child', string='Child', required=True, readonly=True)
     checkin_id = fields.Many2one('kids.child.checkin', string='Check-in Record', readonly=True)
@@ -12,7 +26,7 @@ class CheckoutWizard(models.TransientModel):
     # Checkout OTP fields
     checkout_otp_sent = fields.Boolean('Checkout OTP Sent', default=False)
     checkout_otp_code = fields.Char('Enter Checkout OTP', size=6)
-    sent_checkout_otp_code = fields.Char('Sent Checkout OTP Code', readonly=True, help='OTP code that was sent (for testing)')
+    sent_checkout_otp_code = fields.Char('Sent Checkout OTP (masked)', readonly=True, help='Last two digits of the OTP that was sent')
     
     # State management
     current_state = fields.Selection([
@@ -30,19 +44,18 @@ class CheckoutWizard(models.TransientModel):
         child_id = self.env.context.get('default_child_id')
         if child_id:
             # Find active check-in record
-            active_checkin = self.env['kids.child.checkin'].search([
-                ('child_id', '=', child_id),
-                ('state', 'in', ['checked_in', 'pending_checkout_otp'])
-            ], limit=1)
+            active_checkin = self.env['kids.child.checkin']._get_active_for_child(
+                child_id, ('checked_in', 'pending_checkout_otp')
+            )
             
             if active_checkin:
-                res['checkin_id'] = active_checkin.id
+                res['checkin_id'] = active_checkin['id']
                 
                 # If already in checkout OTP pending state, show that
-                if active_checkin.state == 'pending_checkout_otp':
+                if active_checkin['state'] == 'pending_checkout_otp':
                     res['current_state'] = 'pending_otp'
                     res['checkout_otp_sent'] = True
-                    res['sent_checkout_otp_code'] = active_checkin.checkout_otp_code
+                    res['sent_checkout_otp_code'] = _mask_otp(active_checkin['checkout_otp_last2'])
                 else:
                     res['current_state'] = 'ready'
         
@@ -64,18 +77,10 @@ class CheckoutWizard(models.TransientModel):
         # Update wizard state
         self.current_state = 'pending_otp'
         self.checkout_otp_sent = True
-        self.sent_checkout_otp_code = self.checkin_id.checkout_otp_code
+        self.sent_checkout_otp_code = _mask_otp(self.checkin_id.checkout_otp_last2)
         
         # Return action to refresh wizard and show OTP input
-        return {
-            'type': 'ir.actions.act_window',
-            'name': 'Checkout - Enter OTP',
-            'res_model': 'kids.checkout.wizard',
-            'res_id': self.id,
-            'view_mode': 'form',
-            'target': 'new',
-            'context': self.env.context,
-        }
+        return {**_RELOAD_CHECKOUT, 'res_id': self.id, 'context': _reload_context(self.env.context)}
     
     def action_verify_checkout_otp(self):
         """Verify checkout OTP and complete checkout"""
@@ -91,9 +96,6 @@ class CheckoutWizard(models.TransientModel):
         try:
             result = self.checkin_id.action_verify_checkout_otp(self.checkout_otp_code)
             
-            # Update wizard state
-            self.current_state = 'completed'
-            
             # Auto-close wizard after successful checkout
             return {
                 'type': 'ir.actions.act_window_close'
@@ -112,15 +114,7 @@ class CheckoutWizard(models.TransientModel):
         # Resend checkout OTP
         result = self.checkin_id.action_resend_checkout_otp()
         self.checkout_otp_code = False  # Clear previous OTP entry
-        self.sent_checkout_otp_code = self.checkin_id.checkout_otp_code
+        self.sent_checkout_otp_code = _mask_otp(self.checkin_id.checkout_otp_last2)
         
         # Return action to refresh wizard
-        return {
-            'type': 'ir.actions.act_window',
-            'name': 'Checkout - Enter OTP',
-            'res_model': 'kids.checkout.wizard',
-            'res_id': self.id,
-            'view_mode': 'form',
-            'target': 'new',
-            'context': self.env.context,
-        }
+        return {**_RELOAD_CHECKOUT, 'res_id': self.id, 'context': _reload_context(self.env.context)}
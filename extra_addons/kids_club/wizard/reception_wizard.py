@@ -38,6 +38,8 @@ class ReceptionWizard(models.TransientModel):
 
     # Children Information
     available_children_ids = fields.One2many('kids.child', related='parent_id.children_ids', string='Available Children', readonly=True)
+    child_ids = fields.Many2many('kids.child', string='Selected Children',
+                                 help='Children the selected action applies to')
 
     # Action Selection
     action_type = fields.Selection([
@@ -68,10 +70,14 @@ class ReceptionWizard(models.TransientModel):
     @api.depends('package_ids')
     def _compute_total_amount(self):
         for record in self:
+            if not record.package_ids:
+                record.total_amount = 0.0
+                continue
             record.total_amount = sum(record.package_ids.mapped('price'))
 
     @api.depends('parent_id', 'child_ids', 'action_type', 'package_ids')
     def _compute_summary(self):
+        action_labels = dict(self._fields['action_type'].selection)
         for record in self:
             summary_lines = []
             if record.parent_id:
@@ -80,7 +86,7 @@ class ReceptionWizard(models.TransientModel):
                 child_names = ', '.join(record.child_ids.mapped('name'))
                 summary_lines.append(f"Children: {child_names}")
             if record.action_type:
-                summary_lines.append(f"Action: {dict(record._fields['action_type'].selection)[record.action_type]}")
+                summary_lines.append(f"Action: {action_labels[record.action_type]}")
             if record.package_ids:
                 package_names = ', '.join(record.package_ids.mapped('name'))
                 summary_lines.append(f"Packages: {package_names}")
@@ -92,19 +98,21 @@ class ReceptionWizard(models.TransientModel):
     @api.onchange('parent_id')
     def _onchange_parent_id(self):
         if self.parent_id:
-            # Fill parent details
-            self.parent_name = self.parent_id.name
-            self.parent_mobile = self.parent_id.mobile
-            self.parent_email = self.parent_id.email
-            
-            # Load available children
-            self.available_children_ids = self.parent_id.children_ids
+            # Fill parent details and load available children
+            self.update({
+                'parent_name': self.parent_id.name,
+                'parent_mobile': self.parent_id.mobile,
+                'parent_email': self.parent_id.email,
+                'available_children_ids': self.parent_id.children_ids,
+            })
         else:
             # Clear fields
-            self.parent_name = False
-            self.parent_mobile = False
-            self.parent_email = False
-            self.available_children_ids = False
+            self.update({
+                'parent_name': False,
+                'parent_mobile': False,
+                'parent_email': False,
+                'available_children_ids': False,
+            })
 
     def action_next_step(self):
         """Move to next step in wizard"""
@@ -169,25 +177,22 @@ class ReceptionWizard(models.TransientModel):
         if not self.package_ids:
             raise UserError("No packages selected for purchase.")
         
-        # Create subscriptions for each child
-        subscriptions = self.env['kids.child.subscription']
-        for child in self.child_ids:
-            subscription_vals = {
-                'child_id': child.id,
-                'package_ids': [(6, 0, self.package_ids.ids)],
-                'start_date': fields.Date.today(),
-                'state': 'draft',
-            }
-            subscription = self.env['kids.child.subscription'].create(subscription_vals)
-            subscriptions |= subscription
+        # Create subscriptions for all children in one call
+        today = fields.Date.today()
+        subscriptions = self.env['kids.child.subscription'].create([{
+            'child_id': child.id,
+            'package_ids': [(6, 0, self.package_ids.ids)],
+            'start_date': today,
+            'state': 'draft',
+        } for child in self.child_ids])
         
         # Confirm subscriptions to create POS orders
-        subscriptions.action_confirm()
+        for subscription in subscriptions:
+            subscription.action_confirm()
         
         # Auto check-in if requested
         if self.auto_checkin:
-            for child in self.child_ids:
-                self._create_checkin(child)
+            self._create_checkins(self.child_ids)
         
         return {
             'type': 'ir.actions.client',
@@ -201,10 +206,7 @@ class ReceptionWizard(models.TransientModel):
 
     def _process_quick_checkin(self):
         """Process quick check-in for selected children"""
-        checked_in_count = 0
-        for child in self.child_ids:
-            if self._create_checkin(child):
-                checked_in_count += 1
+        checked_in_count = len(self._create_checkins(self.child_ids))
         
         return {
             'type': 'ir.actions.client',
@@ -218,17 +220,18 @@ class ReceptionWizard(models.TransientModel):
 
     def _process_quick_checkout(self):
         """Process quick check-out for selected children"""
-        checked_out_count = 0
-        for child in self.child_ids:
-            # Find active check-in
-            active_checkin = self.env['kids.child.checkin'].search([
-                ('child_id', '=', child.id),
-                ('state', '=', 'checked_in')
-            ], limit=1)
-            
-            if active_checkin:
-                active_checkin.action_checkout()
-                checked_out_count += 1
+        # Find all active check-ins in one query, one per child
+        active_checkins = self.env['kids.child.checkin'].search([
+            ('child_id', 'in', self.child_ids.ids),
+            ('state', '=', 'checked_in')
+        ])
+        checkin_by_child = {}
+        for checkin in active_checkins:
+            checkin_by_child.setdefault(checkin.child_id.id, checkin)
+        
+        for checkin in checkin_by_child.values():
+            checkin.action_checkout()
+        checked_out_count = len(checkin_by_child)
         
         return {
             'type': 'ir.actions.client',
@@ -240,44 +243,69 @@ class ReceptionWizard(models.TransientModel):
             }
         }
 
-    def _create_checkin(self, child):
-        """Create check-in for a child"""
-        try:
-            # Check if child has active subscription
-            active_subscription = self.env['kids.child.subscription'].search([
-                ('child_id', '=', child.id),
-                ('state', '=', 'active'),
-                ('remaining_visits', '>', 0)
-            ], limit=1)
-            
-            if not active_subscription:
-                return False
-            
-            # Check if already checked in
-            existing_checkin = self.env['kids.child.checkin'].search([
-                ('child_id', '=', child.id),
-                ('state', '=', 'checked_in')
-            ], limit=1)
-            
-            if existing_checkin:
-                return False
-            
-            # Create check-in directly (bypass OTP for reception)
-            checkin_vals = {
+    def _create_checkins(self, children):
+        """Create check-ins for the children that have an active subscription"""
+        Checkin = self.env['kids.child.checkin']
+        Subscription = self.env['kids.child.subscription']
+        # Active subscriptions and current check-ins for all children at once,
+        # reading only the columns the checks below need
+        sub_by_child = {}
+        for sub in Subscription.search_read([
+            ('child_id', 'in', children.ids),
+            ('state', '=', 'active'),
+            ('remaining_visits', '>', 0)
+        ], ['child_id', 'visits_used']):
+            sub_by_child.setdefault(sub['child_id'][0], sub)
+        
+        checked_in = {checkin['child_id'][0] for checkin in Checkin.search_read([
+            ('child_id', 'in', children.ids),
+            ('state', '=', 'checked_in')
+        ], ['child_id'])}
+        
+        # Create check-ins directly (bypass OTP for reception)
+        now = fields.Datetime.now()
+        vals_list = []
+        used_subscriptions = []
+        for child in children:
+            sub = sub_by_child.get(child.id)
+            if not sub or child.id in checked_in:
+                continue
+            vals_list.append({
                 'child_id': child.id,
-                'subscription_id': active_subscription.id,
-                'checkin_time': fields.Datetime.now(),
+                'subscription_id': sub['id'],
+                'checkin_time': now,
                 'state': 'checked_in',
-            }
-            
-            self.env['kids.child.checkin'].create(checkin_vals)
-            
-            # Update subscription visits
-            active_subscription.visits_used += 1
-            
-            return True
-        except Exception:
-            return False
+            })
+            used_subscriptions.append(sub)
+        
+        if not vals_list:
+            return Checkin
+        try:
+            with self.env.cr.savepoint():
+                return self._create_checkin_batch(vals_list, used_subscriptions)
+        except UserError:
+            pass
+        
+        # A check-in in the batch was rejected: retry child by child so the others still go through
+        checkin_ids = []
+        for vals, sub in zip(vals_list, used_subscriptions):
+            try:
+                with self.env.cr.savepoint():
+                    checkin_ids += self._create_checkin_batch([vals], [sub]).ids
+            except UserError:
+                continue
+        return Checkin.browse(checkin_ids)
+    
+    def _create_checkin_batch(self, vals_list, subscriptions):
+        """Create the check-ins and consume one visit on each matching subscription"""
+        checkins = self.env['kids.child.checkin'].create(vals_list)
+        
+        # Update subscription visits
+        Subscription = self.env['kids.child.subscription']
+        for sub in subscriptions:
+            Subscription.browse(sub['id']).write({'visits_used': sub['visits_used'] + 1})
+        
+        return checkins
     
     # Child Management Action Methods
     def action_save_child(self):
@@ -298,14 +326,13 @@ class ReceptionWizard(models.TransientModel):
         new_child = self.env['kids.child'].create(child_vals)
         
         # Clear temporary fields
-        self.temp_child_name_en = False
-        self.temp_child_name_ar = False
-        self.temp_child_notes = False
-        self.temp_child_hijri = False
-        self.temp_child_dob = False
-        
-        # Refresh available children
-        self.available_children_ids = self.parent_id.children_ids
+        self.write({
+            'temp_child_name_en': False,
+            'temp_child_name_ar': False,
+            'temp_child_notes': False,
+            'temp_child_hijri': False,
+            'temp_child_dob': False,
+        })
         
         return True
     
@@ -398,9 +425,6 @@ class ReceptionWizard(models.TransientModel):
         child_name = child.name
         child.unlink()
         
-        # Refresh available children
-        self.available_children_ids = self.parent_id.children_ids
-        
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
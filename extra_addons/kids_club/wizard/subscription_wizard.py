@@ -6,6 +6,9 @@ class KidsSubscriptionWizard(models.TransientModel):
     _name = 'kids.subscription.wizard'
     _description = 'Kids Subscription Wizard'
 
+    # Above this many packages, sum prices in the database instead of reading each row
+    SQL_SUM_MIN_PACKAGES = 20
+
     parent_id = fields.Many2one('res.partner', string='Parent', required=True)
     child_ids = fields.Many2many('kids.child', string='Children', required=True)
     package_ids = fields.Many2many('subscription.package', string='Packages', required=True)
@@ -25,9 +28,24 @@ class KidsSubscriptionWizard(models.TransientModel):
     @api.depends('child_ids', 'package_ids')
     def _compute_totals(self):
         for wizard in self:
-            wizard.total_children = len(wizard.child_ids)
+            children_count = len(wizard.child_ids)
+            packages_price = wizard._get_packages_price()
+            wizard.total_children = children_count
             wizard.total_packages = len(wizard.package_ids)
-            wizard.total_amount = sum(wizard.package_ids.mapped('price')) * len(wizard.child_ids)
+            wizard.total_amount = packages_price * children_count
+    
+    def _get_packages_price(self):
+        """Sum the prices of the selected packages"""
+        packages = self.package_ids
+        if not packages:
+            return 0.0
+        if len(packages) <= self.SQL_SUM_MIN_PACKAGES:
+            return sum(packages.mapped('price'))
+        # Archived packages in the selection count too, as in the mapped() branch
+        groups = self.env['subscription.package'].with_context(active_test=False).read_group(
+            [('id', 'in', packages._origin.ids)], ['price:sum'], []
+        )
+        return groups and groups[0]['price'] or 0.0
     
     def action_create_subscriptions(self):
         """Create subscriptions for all selected children with selected packages"""
@@ -38,21 +56,19 @@ class KidsSubscriptionWizard(models.TransientModel):
         if not self.package_ids:
             raise ValidationError("Please select at least one package.")
         
-        created_subscriptions = self.env['kids.child.subscription']
+        child_names = self.child_ids.mapped('name')
+        package_names = self.package_ids.mapped('name')
         
-        # Create subscription for each child
-        for child in self.child_ids:
-            subscription_vals = {
-                'child_id': child.id,
-                'package_ids': [(6, 0, self.package_ids.ids)],
-                'state': 'draft',
-            }
-            
-            subscription = self.env['kids.child.subscription'].create(subscription_vals)
-            created_subscriptions |= subscription
-            
-            # Auto-confirm if requested
-            if self.confirm_subscriptions:
+        # Create subscriptions for all children in one call
+        created_subscriptions = self.env['kids.child.subscription'].create([{
+            'child_id': child.id,
+            'package_ids': [(6, 0, self.package_ids.ids)],
+            'state': 'draft',
+        } for child in self.child_ids])
+        
+        # Auto-confirm if requested
+        if self.confirm_subscriptions:
+            for subscription in created_subscriptions:
                 subscription.action_confirm()
         
         # Create bulk POS orders if requested
@@ -62,8 +78,8 @@ class KidsSubscriptionWizard(models.TransientModel):
         # Show success message
         message = (
             f"Successfully created {len(created_subscriptions)} subscriptions!\n\n"
-            f"Children: {', '.join(self.child_ids.mapped('name'))}\n"
-            f"Packages: {', '.join(self.package_ids.mapped('name'))}\n"
+            f"Children: {', '.join(child_names)}\n"
+            f"Packages: {', '.join(package_names)}\n"
             f"Total Amount: {self.total_amount:.2f} {self.currency_id.name}"
         )
         
@@ -116,41 +132,52 @@ class KidsSubscriptionWizard(models.TransientModel):
         
         pos_order = self.env['pos.order'].create(pos_order_vals)
         
-        # Add order lines for each subscription
-        for subscription in subscriptions:
-            for package in subscription.package_ids:
-                if package.linked_product_id:
-                    product = package.linked_product_id
-                    
-                    # Calculate taxes properly
-                    taxes = product.taxes_id.filtered(lambda t: t.company_id == pos_config.company_id)
-                    price_unit = package.price
-                    
-                    # Compute tax amount
-                    tax_results = taxes.compute_all(
-                        price_unit, 
-                        currency=pos_config.currency_id,
-                        quantity=1,
-                        product=product,
-                        partner=self.parent_id
-                    )
-                    
-                    line_tax = tax_results['total_included'] - tax_results['total_excluded']
-                    
-                    # Create POS order line
-                    self.env['pos.order.line'].create({
-                        'order_id': pos_order.id,
-                        'product_id': product.id,
-                        'qty': 1,
-                        'price_unit': price_unit,
-                        'price_subtotal': tax_results['total_excluded'],
-                        'price_subtotal_incl': tax_results['total_included'],
-                        'full_product_name': f"{package.name} - {subscription.child_id.name}",
-                        'tax_ids': [(6, 0, taxes.ids)],
-                    })
-                    
-                    total_amount += tax_results['total_included']
-                    total_tax += line_tax
+        # Read packages, products and their taxes for all subscriptions up front
+        subscriptions.mapped('package_ids.linked_product_id.taxes_id')
+        pairs = [
+            (subscription, package)
+            for subscription in subscriptions
+            for package in subscription.package_ids
+            if package.linked_product_id
+        ]
+        
+        # Collect order lines for each subscription
+        line_vals = []
+        tax_cache = {}
+        for subscription, package in pairs:
+            product = package.linked_product_id
+            price_unit = package.price
+            
+            # Compute taxes once per product and price
+            key = (product.id, price_unit)
+            if key not in tax_cache:
+                taxes = product.taxes_id.filtered(lambda t: t.company_id == pos_config.company_id)
+                tax_cache[key] = (taxes, taxes.compute_all(
+                    price_unit, 
+                    currency=pos_config.currency_id,
+                    quantity=1,
+                    product=product,
+                    partner=self.parent_id
+                ))
+            taxes, tax_results = tax_cache[key]
+            
+            line_tax = tax_results['total_included'] - tax_results['total_excluded']
+            
+            line_vals.append({
+                'order_id': pos_order.id,
+                'product_id': product.id,
+                'qty': 1,
+                'price_unit': price_unit,
+                'price_subtotal': tax_results['total_excluded'],
+                'price_subtotal_incl': tax_results['total_included'],
+                'full_product_name': f"{package.name} - {subscription.child_id.name}",
+                'tax_ids': [(6, 0, taxes.ids)],
+            })
+            
+            total_amount += tax_results['total_included']
+            total_tax += line_tax
+        
+        self.env['pos.order.line'].create(line_vals)
         
         # Update POS order with computed totals
         pos_order.write({
@@ -159,8 +186,7 @@ class KidsSubscriptionWizard(models.TransientModel):
         })
         
         # Link POS order to all subscriptions
-        for subscription in subscriptions:
-            subscription.pos_order_id = pos_order.id
+        subscriptions.write({'pos_order_id': pos_order.id})
         
         # Show success message and open POS
         message = (